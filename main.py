@@ -5,38 +5,58 @@
 # Created by Sam Scherer and Tyler Jones
 ###########################################################################
 
+import argparse
+import asyncio
+import itertools
 import json
 import re
+import sys
 from colorama import Fore, Style, init as colorama_init
 from source import delta_finder
 from source.peptide import Peptide
-from source.delta import Delta
+from source.delta import Delta, DeltaType
 from source.delta_set import DeltaSet
+from source import batch
+from source import parallel_search
+from source import query_server
+from source.mass_table import MASS_TABLE_PATH, get_mass_table
+from source.registry import get_registry
+from source.result_cache import ResultCache
+from source.search_stats import SearchStats, measure_peak_memory
+from source.tolerance_sweep import ToleranceSweep
 
-def print_pretty_solutions(ugly_solutions, sequence, expected_mass, n_terminus, c_terminus):
+def print_pretty_solutions(solution_groups, peptide, max_placements=5):
     '''
-    Prints a solution in a table of sequences and expected masses (where deleted residues are shown in red).
+    Prints grouped solutions in a table of sequences and expected masses (where truncated and deleted residues are shown
+    in red and modified residues in yellow). Only the first max_placements placements of each group are expanded.
     '''
-    if not ugly_solutions:
-        print(f'{Fore.RED} No potential solutions found, try increasing your confidence interval.')
-        exit()
+    if not solution_groups:
+        print(f'{Fore.RED} No potential solutions found, try increasing your confidence interval.{Style.RESET_ALL}')
+        return
 
-    sequence_column_length = len(sequence) + len(n_terminus) + len(c_terminus)
-    print(f'{Fore.BLUE}Sequence{' ' * (sequence_column_length - len('Sequence ') if sequence_column_length > len('Sequence ') else 0)}\tExpected Mass{Style.RESET_ALL}')
-    
-    # Loop through the sequence predictions and color deleted residues red
-    for ugly_solution in ugly_solutions:
-        deleted_residues = ugly_solution['residues']
-        pretty_sequence = n_terminus + '--'
-        for i in range(len(sequence)):
-            if i in deleted_residues:
-                pretty_sequence += f'{Fore.RED}{sequence[i]}{Style.RESET_ALL}'
-            else:
-                pretty_sequence += sequence[i]
-        pretty_sequence += '--'
-        pretty_sequence += c_terminus
-        print(pretty_sequence + '\t' + str(expected_mass - ugly_solution['mass']))
-        
+    sequence = peptide.sequence
+    sequence_column_length = len(sequence) + len(peptide.n_termini_species) + len(peptide.c_termini_species) + 4
+    print(f'{Fore.BLUE}Sequence{" " * (sequence_column_length - len("Sequence") if sequence_column_length > len("Sequence") else 0)}\tExpected Mass\tDeltas{Style.RESET_ALL}')
+
+    for solution_group in solution_groups:
+        expected_mass = round(peptide.mass - solution_group.delta_set.mass, 4)
+        deltas = ', '.join(delta.description for delta in solution_group.delta_set.deltas)
+        for placement in itertools.islice(solution_group.iter_placements(), max_placements):
+            # Loop through the sequence and color the residues of the placement
+            colors = {position: Fore.RED if delta.type == DeltaType.DELETION else Fore.YELLOW for position, delta in placement}
+            colors.update({i: Fore.RED for i in range(solution_group.truncated)})
+            pretty_sequence = peptide.n_termini_species + '--'
+            for i in range(len(sequence)):
+                if i in colors:
+                    pretty_sequence += f'{colors[i]}{sequence[i]}{Style.RESET_ALL}'
+                else:
+                    pretty_sequence += sequence[i]
+            pretty_sequence += '--'
+            pretty_sequence += peptide.c_termini_species
+            print(pretty_sequence + '\t' + str(expected_mass) + '\t' + deltas)
+        hidden = solution_group.count_placements() - max_placements
+        if hidden > 0:
+            print(f'{Fore.BLUE}...and {hidden} more placements of the same deltas{Style.RESET_ALL}')
 
 def get_user_input():
     '''
@@ -44,8 +64,9 @@ def get_user_input():
     '''
 
     # Non-canonical amino acids or protecting groups?
-    residues = json.loads(open('data/residues.json').read())
-    non_canonicals = [residue for residue in residues if residues[residue]['non_canonical']]
+    registry = get_registry()
+    residues = dict(registry.residues)
+    non_canonicals = list(registry.non_canonicals)
     while True:
         have_non_canonical = input('Does your sequence include any non-canonical amino acids or protecting groups that are not removed during cleavage? (yes/no): ').lower()
         if have_non_canonical == 'yes':
@@ -103,7 +124,7 @@ def get_user_input():
         break
 
     # Get N-Terminus
-    termini_species_masses = json.loads(open('data/termini_species.json').read())
+    termini_species_masses = registry.termini_species_masses
     print('Here are the possible chemical species for your termini for reference: ')
     print(list(termini_species_masses.keys()))
     while True:
@@ -150,12 +171,141 @@ def print_intro():
     print(open('resources/mass-fixer-ascii-art.txt').read())
     print('MassFixer is a tool for detecting possible reasons for differences between')
     print('observed and expected masses of synthetic peptides. It is currently capable')
-    print('of handling the following potential synthesis issues: \n - residue deletions\n - truncations\n')
+    print('of handling the following potential synthesis issues: \n - residue deletions\n - truncations\n - oxidations, deamidations, protecting groups, pyroglutamate, adducts and incomplete Fmoc removal (with --modifications)\n')
     print('#############################################################')
     print('#############################################################\n')
 
 
+def run_batch(path, format, processes, top_k, cache_path, delta_types, max_nodes, mass_table_path, profile, profile_memory):
+    '''
+    Streams samples from a CSV/JSONL file (or stdin for "-") through a process pool and writes one JSONL record per sample to stdout
+    '''
+    if format is None:
+        format = 'csv' if path.lower().endswith('.csv') else 'jsonl'
+    file = sys.stdin if path == '-' else open(path, newline='')
+    with file:
+        batch.write_records(batch.run_batch(batch.read_samples(file, format), processes, top_k=top_k, cache_path=cache_path, delta_types=delta_types, max_nodes=max_nodes, mass_table_path=mass_table_path, profile=profile, profile_memory=profile_memory), sys.stdout)
+
+def run_library(path, format, delta_types):
+    '''
+    Solves a CSV/JSONL file (or stdin for "-") of samples of related sequences with one shared search and writes one JSONL record per sample to stdout
+    '''
+    if format is None:
+        format = 'csv' if path.lower().endswith('.csv') else 'jsonl'
+    file = sys.stdin if path == '-' else open(path, newline='')
+    with file:
+        batch.write_records(batch.solve_library(batch.read_samples(file, format), delta_types), sys.stdout)
+
+def parse_peaks(peaks, tolerance):
+    '''
+    Parses a list of MASS or MASS:TOLERANCE peaks, which take the given tolerance if they do not give their own
+    '''
+    parsed_peaks = []
+    for peak in peaks:
+        observed_mass, _, peak_tolerance = peak.partition(':')
+        parsed_peaks.append((float(observed_mass), float(peak_tolerance) if peak_tolerance else tolerance))
+    return parsed_peaks
+
+def run_peaks(sequence, n_terminus, c_terminus, peaks, tolerance, delta_types):
+    '''
+    Resolves a list of MASS or MASS:TOLERANCE peaks against one sequence and writes one JSONL record per peak to stdout
+    '''
+    batch.write_records(batch.solve_peaks(sequence, n_terminus, c_terminus, parse_peaks(peaks, tolerance), delta_types), sys.stdout)
+
+def run_fragments(sequence, n_terminus, c_terminus, peaks, tolerance):
+    '''
+    Finds the truncations and internal fragments of one sequence that explain a list of MASS or MASS:TOLERANCE peaks and writes one JSONL record per peak to stdout
+    '''
+    batch.write_records(batch.solve_fragments(sequence, n_terminus, c_terminus, parse_peaks(peaks, tolerance)), sys.stdout)
+
+def run_charge_states(sequence, n_terminus, c_terminus, mz_values, charges, carriers, tolerance, delta_types):
+    '''
+    Resolves m/z values at every charge and carrier against one sequence and writes one JSONL record per assignment to stdout
+    '''
+    batch.write_records(batch.solve_charge_states(sequence, n_terminus, c_terminus, mz_values, charges, tolerance, carriers, delta_types), sys.stdout)
+
+def parse_charges(charges):
+    '''
+    Parses charges given as a range ("1-8") or a list ("1,2,4")
+    '''
+    try:
+        if '-' in charges:
+            first, last = charges.split('-')
+            parsed_charges = list(range(int(first), int(last) + 1))
+        else:
+            parsed_charges = [int(charge) for charge in charges.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid charges '{charges}'")
+    if not parsed_charges or min(parsed_charges) < 1:
+        raise argparse.ArgumentTypeError(f"invalid charges '{charges}'")
+    return parsed_charges
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Determine potential causes of differences between expected and observed masses of synthetic peptides.')
+    parser.add_argument('--batch', metavar='PATH', help='run non-interactively on a CSV/JSONL file of samples ("-" for stdin) with the columns ' + ', '.join(batch.SAMPLE_FIELDS))
+    parser.add_argument('--library', metavar='PATH', help='like --batch, but for a library of related sequences (e.g. a scan or a plate of variants), which are searched together')
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help='format of the batch or library input (default: from the file extension, jsonl for stdin)')
+    parser.add_argument('--processes', type=int, help='number of worker processes for batch mode (default: all cores), to split a single query across, or for the server\'s heavy searches')
+    parser.add_argument('--top-k', type=int, help='only find the K most likely solutions')
+    parser.add_argument('--cache', metavar='PATH', help='SQLite file to cache solutions in across runs')
+    parser.add_argument('--peaks', nargs='+', metavar='MASS[:TOLERANCE]', help='resolve a list of observed masses against one sequence, given with --sequence, --n-terminus and --c-terminus')
+    parser.add_argument('--fragments', nargs='+', metavar='MASS[:TOLERANCE]', help='find the N-terminal truncations, C-terminal truncations and internal fragments of one sequence, given with --sequence, --n-terminus and --c-terminus, that explain a list of observed masses')
+    parser.add_argument('--mz', nargs='+', type=float, metavar='MZ', help='resolve a list of m/z values at every charge in --charges against one sequence, given with --sequence, --n-terminus and --c-terminus')
+    parser.add_argument('--charges', type=parse_charges, default=[1], help='charges to try for --mz, as a range (1-8) or a list (1,2,4) (default: 1)')
+    parser.add_argument('--carriers', nargs='+', default=['H+'], choices=list(get_registry().charge_carrier_masses), help='ions that carry the charge for --mz (default: %(default)s)')
+    parser.add_argument('--sequence', help='sequence of the peptide for --peaks, --fragments and --mz')
+    parser.add_argument('--n-terminus', default='H', help='chemical species at the N-terminus for --peaks, --fragments and --mz (default: %(default)s)')
+    parser.add_argument('--c-terminus', default='OH', help='chemical species at the C-terminus for --peaks, --fragments and --mz (default: %(default)s)')
+    parser.add_argument('--tolerance', type=float, default=1, help='tolerance in Daltons of peaks that do not give their own, or in m/z for --mz (default: %(default)s)')
+    parser.add_argument('--max-nodes', type=int, help='stop each search after expanding this many nodes and report the solutions found so far')
+    parser.add_argument('--profile', action='store_true', help='report the timings and counters of each search as JSON (on stderr, or in each record in batch mode)')
+    parser.add_argument('--profile-memory', action='store_true', help='like --profile, but also run each search a second time with allocation tracing to report its peak memory')
+    parser.add_argument('--mass-table', metavar='PATH', nargs='?', const=MASS_TABLE_PATH, help='answer deletion searches from a table built by scripts/generate_mass_combinations.py (default: %(const)s)')
+    parser.add_argument('--serve', metavar='ADDRESS', help='run a server that answers JSON line queries on a Unix socket at this path, or on TCP for HOST:PORT')
+    parser.add_argument('--warm-peptides', type=int, default=256, help='number of peptides whose search spaces the server keeps warm (default: %(default)s)')
+    parser.add_argument('--modifications', action='store_true', help='also search oxidations, deamidations, protecting groups, pyroglutamate, adducts and incomplete Fmoc removal')
+    args = parser.parse_args()
+    if args.peaks and not args.sequence:
+        parser.error('--peaks requires --sequence')
+    if args.fragments and not args.sequence:
+        parser.error('--fragments requires --sequence')
+    if args.mz and not args.sequence:
+        parser.error('--mz requires --sequence')
+    if args.mass_table and args.modifications:
+        parser.error('--mass-table only holds deletions and cannot be used with --modifications')
+    if args.mass_table and args.top_k is not None:
+        parser.error('--mass-table answers exhaustive searches and cannot be used with --top-k')
+    if args.mass_table:
+        # Opened once here, so a missing or invalid table fails before any worker starts
+        try:
+            get_mass_table(args.mass_table)
+        except (OSError, ValueError) as e:
+            parser.error(f"cannot open the mass table '{args.mass_table}': {e}")
+    args.delta_types = set(DeltaType) - {DeltaType.TRUNCATION} if args.modifications else None
+    return args
+
+
 if __name__ == '__main__':
+    args = parse_args()
+    if args.serve:
+        asyncio.run(query_server.serve(args.serve, max_peptides=args.warm_peptides, delta_types=args.delta_types, max_nodes=args.max_nodes, processes=args.processes))
+        exit()
+    if args.library:
+        run_library(args.library, args.format, args.delta_types)
+        exit()
+    if args.batch:
+        run_batch(args.batch, args.format, args.processes, args.top_k, args.cache, args.delta_types, args.max_nodes, args.mass_table, args.profile, args.profile_memory)
+        exit()
+    if args.peaks:
+        run_peaks(args.sequence, args.n_terminus, args.c_terminus, args.peaks, args.tolerance, args.delta_types)
+        exit()
+    if args.fragments:
+        run_fragments(args.sequence, args.n_terminus, args.c_terminus, args.fragments, args.tolerance)
+        exit()
+    if args.mz:
+        run_charge_states(args.sequence, args.n_terminus, args.c_terminus, args.mz, args.charges, args.carriers, args.tolerance, args.delta_types)
+        exit()
+
     colorama_init()
     print_intro()
 
@@ -187,11 +337,38 @@ if __name__ == '__main__':
 
     # Find solutions
     print('Calculating...')
-    solutions = delta_finder.get_solutions(peptide, target_mass, uncertainty)
+    stats = SearchStats(args.max_nodes, args.profile or args.profile_memory)
+    sweep = None
+    if args.cache:
+        solutions = ResultCache(args.cache).get_solutions(peptide, target_mass, uncertainty, top_k=args.top_k, delta_types=args.delta_types, stats=stats)
+    elif args.processes and args.processes > 1 and args.top_k is None:
+        solutions = parallel_search.get_parallel_solutions(peptide, target_mass, uncertainty, stats=stats, delta_types=args.delta_types, processes=args.processes)
+    elif args.mass_table or args.top_k is not None or args.max_nodes is not None or stats.profile:
+        mass_table = get_mass_table(args.mass_table) if args.mass_table else None
+        solutions = delta_finder.get_solutions(peptide, target_mass, uncertainty, top_k=args.top_k, stats=stats, delta_types=args.delta_types, mass_table=mass_table)
+    else:
+        # Searched so that other confidence intervals can be explored afterwards without searching from scratch
+        sweep = ToleranceSweep(peptide, target_mass, delta_types=args.delta_types, stats=stats)
+        solutions = sweep.get_solutions(uncertainty)
+    if stats.partial:
+        print(f'{Fore.YELLOW}The search stopped after {stats.nodes_expanded} nodes, so these solutions may be incomplete.{Style.RESET_ALL}')
+    if args.profile_memory:
+        # A second pass, so that tracing allocations does not slow down the timed search
+        stats.peak_bytes = measure_peak_memory(lambda: delta_finder.get_solutions(peptide, target_mass, uncertainty, top_k=args.top_k, stats=SearchStats(args.max_nodes), delta_types=args.delta_types, mass_table=get_mass_table(args.mass_table) if args.mass_table else None))
+    if stats.profile:
+        print(json.dumps(stats.to_dict()), file=sys.stderr)
 
     # Show solutions to user
-    for solution in solutions:
-        print('\n')
-        print(solution)
-        print('\n')
-    # print_pretty_solutions(solutions, sequence, expected_mass, n_terminus, c_terminus)
\ No newline at end of file
+    print_pretty_solutions([delta_finder.group_solution(peptide, solution) for solution in solutions], peptide)
+
+    # Explore other confidence intervals, which only searches the masses a wider interval newly admits
+    while sweep is not None:
+        ans = input('Enter another confidence interval to see its solutions, or press enter to finish: ')
+        if not ans:
+            break
+        try:
+            uncertainty = float(ans)
+        except ValueError:
+            print('The confidence interval must be a number. Please try again.')
+            continue
+        print_pretty_solutions([delta_finder.group_solution(peptide, solution) for solution in sweep.get_solutions(uncertainty)], peptide)
\ No newline at end of file
@@ -0,0 +1,157 @@
+###########################################################################
+# Benchmarks the stages of delta_finder over generated peptides and checks
+# the results against a stored baseline.
+#
+# Run from the root of the repository:
+#   python scripts/benchmark.py                    (compare with the baseline)
+#   python scripts/benchmark.py --update-baseline  (store a new baseline)
+#
+# Exits with a non-zero status when any stage regresses. The number of results
+# is compared exactly and nodes expanded strictly, as both are deterministic.
+# Peak memory depends on the Python version and wall time on the machine and
+# its load, so memory is only compared on the baseline's Python version and
+# wall time only with --check-time on the baseline's machine and version.
+###########################################################################
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from source import delta_finder
+from source.peptide import Peptide
+from source.search_stats import SearchStats
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'resources', 'benchmark-baseline.json')
+CANONICALS = 'ACDEFGHIKLMNPQRSTVWY'
+LENGTHS = [10, 25, 50, 100, 200]
+TOLERANCES = [.5, 2, 5]
+MAX_DELETIONS = [1, 2, 3, 4, 5, 6]
+
+def generate_case(length: int):
+    '''
+    Generates a peptide of the given length and the delta of an observed peptide that is missing two N-terminal residues
+    and three internal residues.
+    '''
+    rng = random.Random(length)
+    sequence = ''.join(rng.choice(CANONICALS) for _ in range(length))
+    deleted = set(rng.sample(range(2, length), min(3, length - 2)))
+    observed_sequence = ''.join(residue for i, residue in enumerate(sequence) if i >= 2 and i not in deleted)
+    peptide = Peptide(sequence, 'H', 'OH')
+    return peptide, peptide.mass - Peptide(observed_sequence, 'H', 'OH').mass
+
+def get_stages(peptide: Peptide, target_mass: float):
+    '''
+    Gets (stage, tolerance, max_deletions, function) for every benchmarked call, where function takes a SearchStats.
+    '''
+    deltas = delta_finder.get_deltas(peptide)
+    stages = [('get_deltas', None, None, lambda stats: delta_finder.get_deltas(peptide))]
+    for tolerance in TOLERANCES:
+        stages.append(('get_truncations', tolerance, None, lambda stats, tolerance=tolerance: delta_finder.get_truncations(peptide, target_mass, tolerance)))
+        for max_deletions in MAX_DELETIONS:
+            stages.append(('generate_delta_sets', tolerance, max_deletions, lambda stats, tolerance=tolerance, max_deletions=max_deletions: delta_finder.generate_delta_sets(deltas, target_mass, tolerance, max_deletions, stats)))
+            stages.append(('get_solutions', tolerance, max_deletions, lambda stats, tolerance=tolerance, max_deletions=max_deletions: delta_finder.get_solutions(peptide, target_mass, tolerance, max_deletions, stats=stats)))
+    return stages
+
+def measure(function, repeats: int):
+    '''
+    Measures the best wall time over the repeats, then the peak traced memory and the search counters of one more call.
+    '''
+    seconds = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function(None)
+        seconds = min(seconds, time.perf_counter() - start)
+
+    stats = SearchStats()
+    tracemalloc.start()
+    result = function(stats)
+    peak_bytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {'seconds': seconds, 'peak_bytes': peak_bytes, 'nodes_expanded': stats.nodes_expanded, 'results': len(result)}
+
+def run(lengths: list[int], repeats: int):
+    results = []
+    for length in lengths:
+        peptide, target_mass = generate_case(length)
+        for stage, tolerance, max_deletions, function in get_stages(peptide, target_mass):
+            result = {'stage': stage, 'length': length, 'tolerance': tolerance, 'max_deletions': max_deletions} | measure(function, repeats)
+            results.append(result)
+            print(f"{stage:<20}{length:>8}{str(tolerance):>10}{str(max_deletions):>8}{result['seconds'] * 1000:>12.3f} ms{result['peak_bytes'] / 1024:>12.1f} KiB{result['nodes_expanded']:>10} nodes", file=sys.stderr)
+    return results
+
+def get_key(result: dict):
+    return (result['stage'], result['length'], result['tolerance'], result['max_deletions'])
+
+def compare(results: list[dict], baseline: list[dict], time_ratio: float, memory_ratio: float, nodes_ratio: float):
+    '''
+    Gets a description of every result that changed its number of results or regressed beyond the allowed ratio of its
+    baseline. A ratio of None skips its metric.
+    '''
+    baseline = {get_key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        expected = baseline.get(get_key(result))
+        if expected is None:
+            continue
+        case = f"{result['stage']} (length={result['length']}, tolerance={result['tolerance']}, max_deletions={result['max_deletions']})"
+        if result['results'] != expected['results']:
+            regressions.append(f"{case}: results {expected['results']} -> {result['results']}")
+        # Small absolute differences are ignored so that timer and allocator noise on tiny cases does not fail the run
+        for metric, ratio, noise in [('seconds', time_ratio, .005), ('peak_bytes', memory_ratio, 64 * 1024), ('nodes_expanded', nodes_ratio, 0)]:
+            if ratio is not None and result[metric] > expected[metric] * ratio and result[metric] - expected[metric] > noise:
+                regressions.append(f"{case}: {metric} {expected[metric]} -> {result[metric]}")
+    return regressions
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark delta_finder and compare the results with a stored baseline.')
+    parser.add_argument('--output', help='write the results as JSON to this path')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='baseline to compare with (default: %(default)s)')
+    parser.add_argument('--update-baseline', action='store_true', help='store the results as the new baseline instead of comparing')
+    parser.add_argument('--lengths', type=int, nargs='+', default=LENGTHS, help='peptide lengths to benchmark')
+    parser.add_argument('--repeats', type=int, default=3, help='timed calls per case, the best is kept')
+    parser.add_argument('--check-time', action='store_true', help='also fail on wall time regressions, if the baseline was stored on the same machine and Python version')
+    parser.add_argument('--time-ratio', type=float, default=2, help='allowed wall time relative to the baseline with --check-time')
+    parser.add_argument('--memory-ratio', type=float, default=1.5, help='allowed peak memory relative to the baseline')
+    parser.add_argument('--nodes-ratio', type=float, default=1, help='allowed nodes expanded relative to the baseline')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    results = run(args.lengths, args.repeats)
+    report = {'python': platform.python_version(), 'machine': platform.machine(), 'results': results}
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=4)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump(report, file, indent=4)
+        print(f'Stored the baseline in {args.baseline}', file=sys.stderr)
+        exit()
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    same_python = baseline['python'] == report['python']
+    same_machine = same_python and baseline['machine'] == report['machine']
+    if not same_python:
+        print(f"Not comparing peak memory with a baseline from Python {baseline['python']}", file=sys.stderr)
+    if args.check_time and not same_machine:
+        print(f"Not comparing wall time with a baseline from {baseline['machine']} and Python {baseline['python']}", file=sys.stderr)
+    time_ratio = args.time_ratio if args.check_time and same_machine else None
+    regressions = compare(results, baseline['results'], time_ratio, args.memory_ratio if same_python else None, args.nodes_ratio)
+    if regressions:
+        print(f'{len(regressions)} REGRESSIONS against {args.baseline}:', file=sys.stderr)
+        for regression in regressions:
+            print(f'  {regression}', file=sys.stderr)
+        exit(1)
+    print(f'No regressions against {args.baseline}', file=sys.stderr)
@@ -0,0 +1,89 @@
+###########################################################################
+# Compares the original breadth-first search, which was rerun for every
+# truncation, with the shared search space in delta_finder.get_solutions as
+# the sequence grows.
+#
+# Run from the root of the repository: python scripts/benchmark_truncations.py
+###########################################################################
+
+import os
+import random
+import sys
+import time
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from source import delta_finder
+from source.delta import DeltaType
+from source.peptide import Peptide
+from source.registry import get_registry
+from tests.reference_search import get_solutions_per_truncation
+
+CANONICALS = 'ACDEFGHIKLMNPQRSTVWY'
+CONFIDENCE = 2
+MAX_DELETIONS = 4
+
+def generate_baseline_delta_sets(deltas: list[tuple[float, str]], target_mass: float, confidence: float):
+    '''
+    The breadth-first search of the original delta_finder.generate_delta_sets, over sets of residue positions (the
+    original kept every residue as its own Delta), with float masses.
+    '''
+    order = sorted(range(len(deltas)), key=lambda i: deltas[i][0], reverse=True)
+    delta_combinations = []
+    queue = deque([(frozenset(), 0, 0)])
+    visited = set()
+    while queue:
+        positions, mass, start = queue.popleft()
+        if target_mass - confidence <= mass <= target_mass + confidence:
+            delta_combinations.append(positions)
+        if len(positions) >= MAX_DELETIONS or mass >= target_mass + confidence:
+            continue
+        for i in range(start, len(order)):
+            next_positions = positions | {order[i]}
+            if next_positions in visited:
+                continue
+            visited.add(next_positions)
+            queue.append((next_positions, mass + deltas[order[i]][0], i))
+    return delta_combinations
+
+def get_baseline_solutions(peptide: Peptide, target_mass: float, confidence: float):
+    '''
+    The original get_solutions: the deltas of the whole peptide are searched again for every truncation, and every
+    placement of the same residues is a separate solution. Returns the compositions found, as sorted descriptions.
+    '''
+    registry = get_registry()
+    deltas = [(delta.mass, delta.description) for residue in peptide.sequence for delta in registry.residue_deltas[residue] if delta.type == DeltaType.DELETION]
+    compositions = set()
+    truncated_mass = 0
+    for i in range(len(peptide.sequence)):
+        if i > 0:
+            truncated_mass += registry.residue_masses[peptide.sequence[i - 1]]
+            if truncated_mass > target_mass + confidence:
+                break
+        truncation = (f"truncation of '{peptide.sequence[:i]}'",) if i > 0 else ()
+        for positions in generate_baseline_delta_sets(deltas, target_mass - truncated_mass, confidence):
+            compositions.add(tuple(sorted([deltas[position][1] for position in positions] + list(truncation))))
+    return compositions
+
+def time_call(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+random.seed(0)
+print('Length\tSolutions\tBaseline BFS (s)\tShared (s)\tSpeedup')
+for length in [10, 15, 20, 25, 30, 35, 40, 45]:
+    sequence = ''.join(random.choice(CANONICALS) for _ in range(length))
+    peptide = Peptide(sequence, 'H', 'OH')
+    # A fifth of the sequence truncated from the N-terminus and two internal residues deleted
+    observed = Peptide(sequence[length // 5:length // 2] + sequence[length // 2 + 2:], 'H', 'OH')
+    target_mass = peptide.mass - observed.mass
+
+    baseline, baseline_time = time_call(get_baseline_solutions, peptide, target_mass, CONFIDENCE)
+    solutions, shared_time = time_call(delta_finder.get_solutions, peptide, target_mass, CONFIDENCE)
+    assert [repr(solution) for solution in solutions] == [repr(solution) for solution in get_solutions_per_truncation(peptide, target_mass, CONFIDENCE)]
+    # The baseline also pairs truncations with deletions of the residues they removed, so it finds a superset
+    assert {tuple(sorted(delta.description for delta in solution.deltas)) for solution in solutions} <= baseline
+
+    print(f'{length}\t{len(solutions)}\t\t{baseline_time:.3f}\t\t\t{shared_time:.3f}\t\t{baseline_time / shared_time:.0f}x')
@@ -1,30 +1,28 @@
-import json
-from collections import deque
+###########################################################################
+# Builds the table of every combination of up to max_deletions residue
+# deletions, sorted by mass, that delta_finder can binary search instead of
+# searching (see source/mass_table.py).
+#
+# Run from the root of the repository:
+#   PYTHONPATH=. python scripts/generate_mass_combinations.py [--max-deletions 4] [--output PATH]
+#
+# The table records the hash of the residue tables it was built from and is
+# refused once they change, so rerun this after editing data/residues.json.
+###########################################################################
 
-residue_masses = json.loads(open('data/residues.json').read())
-# residue_masses = {'A': 5, 'B': 2, 'C': 1}
-residues = [residue for residue in residue_masses]
-residues_sorted = sorted(residues, key=lambda x: residue_masses[x], reverse=True)
+import argparse
+import sys
+from source.mass_table import MASS_TABLE_PATH, write_mass_table
+from source.registry import get_registry
 
-deltas = []
-root = {'mass': 0, 'residues': [], 'position': 0}
-queue = deque()
-queue.append(root)
-max_deletions = 4
+def parse_args():
+    parser = argparse.ArgumentParser(description='Build the memory-mapped table of residue deletion combinations.')
+    parser.add_argument('--max-deletions', type=int, default=4, help='largest number of deletions in a combination (default: %(default)s)')
+    parser.add_argument('--output', default=MASS_TABLE_PATH, help='path of the table (default: %(default)s)')
+    return parser.parse_args()
 
-while queue:
-    curr_node = queue.popleft()
 
-    # Condition for solution
-    deltas.append(curr_node)
-    
-    # Termination condtion
-    if len(curr_node['residues']) >= max_deletions:
-        continue
-    
-    # Continue recursive search
-    for i in range (curr_node['position'], len(residues_sorted)):
-        next_mass = residue_masses[residues_sorted[i]]
-        queue.append({'mass': curr_node['mass'] + next_mass, 'residues': curr_node['residues'] + [residues_sorted[i]], 'position': i})
-
-print(len(deltas))
+if __name__ == '__main__':
+    args = parse_args()
+    rows = write_mass_table(args.output, get_registry(), args.max_deletions)
+    print(f'Wrote {rows} combinations to {args.output}', file=sys.stderr)
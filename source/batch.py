@@ -0,0 +1,218 @@
+import csv
+import functools
+import json
+import math
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from source import charge_states, delta_finder, fragment_sweep, library_search
+from source.delta import DeltaType
+from source.mass_table import get_mass_table
+from source.peptide import Peptide
+from source.result_cache import ResultCache
+from source.search_stats import SearchStats, measure_peak_memory
+
+SAMPLE_FIELDS = ['sequence', 'n_terminus', 'c_terminus', 'observed_mass', 'tolerance']
+
+def read_samples(file, format: str):
+    '''
+    Streams samples from an open CSV (with a header row) or JSONL file, one dict per sample. A JSONL line that is not
+    valid JSON is yielded as its JSONDecodeError, so that it gets an error record instead of ending the batch.
+    '''
+    if format == 'csv':
+        yield from csv.DictReader(file)
+    elif format == 'jsonl':
+        for line in file:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield e
+    else:
+        raise ValueError(f"Unknown sample format '{format}'")
+
+def parse_finite(value, name: str):
+    '''
+    Parses a mass or tolerance of a sample, rejecting infinities and NaN, which cannot be converted to mass units.
+    '''
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError(f"'{name}' must be a finite number, not {value}")
+    return number
+
+def parse_tolerance(value):
+    '''
+    Parses the tolerance of a sample, which must be finite and not negative.
+    '''
+    tolerance = parse_finite(value, 'tolerance')
+    if tolerance < 0:
+        raise ValueError(f"'tolerance' must not be negative, not {value}")
+    return tolerance
+
+def check_sample(sample):
+    '''
+    Raises the error of a sample that is not a JSON object, such as a line that read_samples could not parse.
+    '''
+    if isinstance(sample, Exception):
+        raise sample
+    if not isinstance(sample, dict):
+        raise TypeError(f'A sample must be a JSON object, not {type(sample).__name__}')
+
+def get_error_record(sample, error: Exception):
+    '''
+    Gets the record of a sample that could not be solved, with the sample's fields if it has any.
+    '''
+    record = {field: sample.get(field) if isinstance(sample, dict) else None for field in SAMPLE_FIELDS}
+    record['error'] = f'{type(error).__name__}: {error}'
+    return record
+
+@functools.cache
+def get_result_cache(path: str):
+    '''
+    Opens the result cache once per worker process.
+    '''
+    return ResultCache(path)
+
+def solve_sample(sample: dict, top_k: int = None, cache_path: str = None, delta_types: set[DeltaType] = None, max_nodes: int = None, mass_table_path: str = None, profile: bool = False, profile_memory: bool = False):
+    '''
+    Finds the solutions for a single sample and returns them as a JSON-serializable record. With a node budget, the
+    record says whether the search ran out of it before finding every solution. With a mass table, each worker maps it
+    once and answers from it instead of searching. With profile, the record has the search's profile, and with
+    profile_memory the search is run a second time with allocation tracing to add its peak memory to the profile.
+    '''
+    profile = profile or profile_memory
+    stats = SearchStats(max_nodes, profile) if max_nodes is not None or profile else None
+    try:
+        check_sample(sample)
+        record = {field: sample.get(field) for field in SAMPLE_FIELDS}
+        peptide = Peptide(str(sample['sequence']).upper(), sample['n_terminus'], sample['c_terminus'])
+        target_mass = peptide.mass - parse_finite(sample['observed_mass'], 'observed_mass')
+        tolerance = parse_tolerance(sample['tolerance'])
+
+        def solve(stats: SearchStats):
+            if cache_path:
+                return get_result_cache(cache_path).get_solutions(peptide, target_mass, tolerance, top_k=top_k, delta_types=delta_types, stats=stats)
+            mass_table = get_mass_table(mass_table_path) if mass_table_path else None
+            return delta_finder.get_solutions(peptide, target_mass, tolerance, top_k=top_k, stats=stats, delta_types=delta_types, mass_table=mass_table)
+
+        solutions = solve(stats)
+        if profile_memory:
+            stats.peak_bytes = measure_peak_memory(lambda: solve(SearchStats(max_nodes)))
+    except (KeyError, TypeError, ValueError, OSError) as e:
+        return get_error_record(sample, e)
+
+    return add_solutions(record, peptide, target_mass, solutions, stats)
+
+def add_solutions(record: dict, peptide: Peptide, target_mass: float, solutions: list, stats: SearchStats = None):
+    '''
+    Adds the expected mass, the delta and the solutions of a sample to its record, and whether the search was partial
+    if it had a node budget and its profile if it was profiled.
+    '''
+    record['expected_mass'] = peptide.mass
+    record['delta_mass'] = target_mass
+    record['solutions'] = [solution.to_dict() for solution in solutions]
+    if stats is not None and stats.max_nodes is not None:
+        record['partial'] = stats.partial
+    if stats is not None and stats.profile:
+        record['profile'] = stats.to_dict()
+    return record
+
+def solve_peaks(sequence: str, n_terminus: str, c_terminus: str, peaks: list[tuple[float, float]], delta_types: set[DeltaType] = None):
+    '''
+    Resolves every (observed mass, tolerance) peak of one sequence in a single pass and returns one record per peak.
+    '''
+    peptide = Peptide(sequence.upper(), n_terminus, c_terminus)
+    records = []
+    for (observed_mass, tolerance), solutions in zip(peaks, delta_finder.get_multi_peak_solutions(peptide, peaks, delta_types=delta_types)):
+        record = {'sequence': peptide.sequence, 'n_terminus': n_terminus, 'c_terminus': c_terminus, 'observed_mass': observed_mass, 'tolerance': tolerance}
+        record['expected_mass'] = peptide.mass
+        record['delta_mass'] = peptide.mass - observed_mass
+        record['solutions'] = [solution.to_dict() for solution in solutions]
+        records.append(record)
+    return records
+
+def solve_fragments(sequence: str, n_terminus: str, c_terminus: str, peaks: list[tuple[float, float]]):
+    '''
+    Finds the N-terminal truncations, C-terminal truncations and internal fragments of one sequence that explain every
+    (observed mass, tolerance) peak, and returns one record per peak.
+    '''
+    peptide = Peptide(sequence.upper(), n_terminus, c_terminus)
+    records = []
+    for observed_mass, tolerance in peaks:
+        record = {'sequence': peptide.sequence, 'n_terminus': n_terminus, 'c_terminus': c_terminus, 'observed_mass': observed_mass, 'tolerance': tolerance}
+        record['expected_mass'] = peptide.mass
+        record['delta_mass'] = peptide.mass - observed_mass
+        record['fragments'] = []
+        for start, end in fragment_sweep.get_fragments(peptide, peptide.mass - observed_mass, tolerance):
+            kind = 'n_terminal_truncation' if end == len(peptide.sequence) else 'c_terminal_truncation' if start == 0 else 'internal'
+            record['fragments'].append({'start': start, 'end': end, 'kind': kind, 'sequence': peptide.sequence[start:end]})
+        records.append(record)
+    return records
+
+def solve_charge_states(sequence: str, n_terminus: str, c_terminus: str, mz_values: list[float], charges: list[int], mz_tolerance: float, carriers: list[str] = ('H+',), delta_types: set[DeltaType] = None):
+    '''
+    Resolves every charge assignment of the m/z values against one sequence and returns one record per assignment,
+    saying whether it has any explanation.
+    '''
+    peptide = Peptide(sequence.upper(), n_terminus, c_terminus)
+    records = []
+    for assignment, solutions in charge_states.get_charge_state_solutions(peptide, mz_values, charges, mz_tolerance, carriers, delta_types=delta_types):
+        record = {'sequence': peptide.sequence, 'n_terminus': n_terminus, 'c_terminus': c_terminus} | assignment
+        record['expected_mass'] = peptide.mass
+        record['delta_mass'] = peptide.mass - assignment['observed_mass']
+        record['explained'] = bool(solutions)
+        record['solutions'] = [solution.to_dict() for solution in solutions]
+        records.append(record)
+    return records
+
+def solve_library(samples, delta_types: set[DeltaType] = None):
+    '''
+    Solves a library of samples of related sequences with one shared search and returns their records in input order.
+    Samples that cannot be parsed get a record with the error and are left out of the search.
+    '''
+    records = []
+    library_samples = []
+    for sample in samples:
+        try:
+            check_sample(sample)
+            record = {field: sample.get(field) for field in SAMPLE_FIELDS}
+            sequence = str(sample['sequence']).upper()
+            Peptide(sequence, sample['n_terminus'], sample['c_terminus'])
+            library_samples.append((sequence, sample['n_terminus'], sample['c_terminus'], parse_finite(sample['observed_mass'], 'observed_mass'), parse_tolerance(sample['tolerance'])))
+        except (KeyError, TypeError, ValueError) as e:
+            record = get_error_record(sample, e)
+        records.append(record)
+
+    library_solutions = iter(library_search.get_library_solutions(library_samples, delta_types=delta_types))
+    library_samples = iter(library_samples)
+    for record in records:
+        if 'error' not in record:
+            sequence, n_terminus, c_terminus, observed_mass, _ = next(library_samples)
+            peptide = Peptide(sequence, n_terminus, c_terminus)
+            add_solutions(record, peptide, peptide.mass - observed_mass, next(library_solutions))
+    return records
+
+def run_batch(samples, processes: int = None, max_pending: int = None, top_k: int = None, cache_path: str = None, delta_types: set[DeltaType] = None, max_nodes: int = None, mass_table_path: str = None, profile: bool = False, profile_memory: bool = False):
+    '''
+    Solves the samples across a pool of processes and yields the records in input order. At most max_pending samples
+    are read ahead of the oldest unfinished one, so memory stays bounded however long the input is.
+    '''
+    processes = processes or os.cpu_count()
+    max_pending = max_pending or 4 * processes
+    pending = deque()
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        for sample in samples:
+            pending.append(executor.submit(solve_sample, sample, top_k, cache_path, delta_types, max_nodes, mass_table_path, profile, profile_memory))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def write_records(records, file):
+    '''
+    Writes the records as JSONL, flushing after each one so results stream to the reader.
+    '''
+    for record in records:
+        file.write(json.dumps(record) + '\n')
+        file.flush()
@@ -0,0 +1,35 @@
+from source import delta_finder
+from source.delta import DeltaType
+from source.peptide import Peptide
+from source.registry import get_registry
+from source.search_stats import SearchStats
+
+def get_charge_assignments(mz_values: list[float], charges: list[int], carriers: list[str] = ('H+',)):
+    '''
+    Gets every assignment of a charge and a charge carrier to the m/z values as a dict. An ion of charge z carried by z
+    of the carrier has a neutral mass of z * (m/z - carrier mass); assignments without a positive neutral mass are left
+    out.
+    '''
+    carrier_masses = get_registry().charge_carrier_masses
+    assignments = []
+    for mz in mz_values:
+        for charge in charges:
+            for carrier in carriers:
+                observed_mass = charge * (mz - carrier_masses[carrier])
+                if observed_mass > 0:
+                    assignments.append({'mz': mz, 'charge': charge, 'carrier': carrier, 'observed_mass': observed_mass})
+    return assignments
+
+def get_charge_state_solutions(peptide: Peptide, mz_values: list[float], charges: list[int], mz_tolerance: float, carriers: list[str] = ('H+',), max_deletions: int = 4, stats: SearchStats = None, delta_types: set[DeltaType] = None):
+    '''
+    Resolves every charge assignment of the m/z values against the peptide and returns (assignment, solutions) pairs.
+    The tolerance is in m/z, so it grows with the charge once converted to a neutral mass.
+
+    All assignments are resolved as peaks of one multi-peak search, so checking many charges costs about as much as a
+    single search rather than one search per charge.
+    '''
+    assignments = get_charge_assignments(mz_values, charges, carriers)
+    for assignment in assignments:
+        assignment['tolerance'] = assignment['charge'] * mz_tolerance
+    peaks = [(assignment['observed_mass'], assignment['tolerance']) for assignment in assignments]
+    return list(zip(assignments, delta_finder.get_multi_peak_solutions(peptide, peaks, max_deletions, stats, delta_types)))
@@ -1,27 +1,70 @@
+import itertools
+import threading
+import weakref
 from enum import Enum
+from source.mass_units import to_units
 
 class DeltaType(Enum):
     DELETION = "DELETION"
     TRUNCATION = "TRUNCATION"
+    OXIDATION = "OXIDATION"
+    DEAMIDATION = "DEAMIDATION"
+    PROTECTING_GROUP = "PROTECTING_GROUP"
+    PYROGLUTAMATE = "PYROGLUTAMATE"
+    ADDUCT = "ADDUCT"
+    INCOMPLETE_FMOC_REMOVAL = "INCOMPLETE_FMOC_REMOVAL"
 
 class Delta:
-    def __init__(self, mass, type: DeltaType, likelihood: int, description=""):
+    __slots__ = ('mass', 'mass_units', 'type', 'likelihood', 'description', 'id', '__weakref__')
+
+    # Every live Delta by its contents, so that equal deltas are one object with one small integer id. Deltas that are
+    # no longer used (e.g. truncations of a peptide that was solved long ago) drop out of the table.
+    interned = weakref.WeakValueDictionary()
+    ids = itertools.count()
+    lock = threading.Lock()
+
+    def __new__(cls, mass, type: DeltaType, likelihood: int, description=""):
         """
-        Initialize a Delta instance with mass, type, and description.
+        Get the Delta with the given mass, type, likelihood, and description, creating it the first time it is needed.
+        Deltas are interned and must be treated as immutable.
         """
+        key = (mass, type, likelihood, description)
+        delta = cls.interned.get(key)
+        if delta is not None:
+            return delta
+
         if not isinstance(type, DeltaType):
             raise ValueError("Type must be an instance of DeltaType Enum")
-        
-        self.mass = mass
-        self.type = type
-        self.description = description
-        self.likelihood = likelihood
+
+        with cls.lock:
+            delta = cls.interned.get(key)
+            if delta is None:
+                delta = super().__new__(cls)
+                delta.mass = mass
+                delta.mass_units = to_units(mass)
+                delta.type = type
+                delta.likelihood = likelihood
+                delta.description = description
+                delta.id = next(cls.ids)
+                cls.interned[key] = delta
+        return delta
+
+    def __reduce__(self):
+        # Ids are only meaningful within a process, so unpickled deltas are interned again
+        return (Delta, (self.mass, self.type, self.likelihood, self.description))
+
+    def to_dict(self):
+        return {'mass': self.mass, 'type': self.type.value, 'likelihood': self.likelihood, 'description': self.description}
+
+    @classmethod
+    def from_dict(cls, delta: dict):
+        return cls(delta['mass'], DeltaType(delta['type']), delta['likelihood'], delta['description'])
 
     def __repr__(self):
         return f"Delta(mass={self.mass}, type={self.type.value}, description='{self.description}')"
 
     def __hash__(self):
-        return hash(self.description)
+        return self.id
     
     def __eq__(self, other):
-        return self.mass == other.mass and self.type == other.type and self.description == other.description
\ No newline at end of file
+        return self is other
@@ -1,87 +1,356 @@
-from collections import deque
-import json
+import heapq
+import itertools
+import time
+from collections import Counter
 from source.peptide import Peptide
 from source.delta import Delta, DeltaType
 from source.delta_set import DeltaSet
+from source.delta_index import DeltaIndex
+from source.delta_space import DeltaSpace
+from source.mass_table import MassTable
+from source.mass_units import from_units, to_units
+from source.mass_windows import MassWindows
+from source.registry import get_registry
+from source.search_stats import SearchStats, is_profiling, time_stage, track_rss
+from source.solution_group import SolutionGroup
 
-def get_deltas(peptide: Peptide):
+def get_deltas(peptide: Peptide, delta_types: set[DeltaType] = None, start: int = 0):
     '''
-    Gets all of the possible deltas based on the provided sequence
+    Gets all of the possible deltas of the given types (deletions only by default) based on the provided sequence, from
+    residue start onwards (the residues left by truncating the first start residues)
     '''
-    # Deletion deltas
-    residues = json.loads(open('data/residues.json').read())
+    registry = get_registry()
+    delta_types = {DeltaType.DELETION} if delta_types is None else delta_types
+
+    # Deltas of single residues (deletions, oxidations, protecting groups, etc.)
     deltas = []
-    for residue in peptide.sequence:
-        residue_deltas = residues[residue]['deltas']
-        for delta in residue_deltas:
-            deltas.append(Delta(delta['mass'], DeltaType(delta['type']), delta['likelihood'], delta['description']))
-    # deltas = [Delta(residues[residue][], DeltaType.DELETION, str(residue)) for residue in peptide.sequence]
+    for i in range(start, len(peptide.sequence)):
+        deltas.extend(get_residue_deltas(peptide, delta_types, i))
 
-    # TODO: Incomplete Fmoc removal, sodium adducts, incomplete deprotection, etc.
+    # Deltas of the whole peptide (adducts, incomplete Fmoc removal), which may occur up to the cap of their class
+    for delta_type, delta_class in registry.delta_classes.items():
+        if delta_type in delta_types and delta_class['position'] == 'peptide' and applies_at(peptide, delta_type, None):
+            for delta in delta_class['deltas']:
+                deltas.extend([delta] * delta_class['max_occurrences'])
 
     return deltas
 
-def generate_delta_sets(deltas: list[Delta], target_mass: float, confidence: float):
+def get_residue_deltas(peptide: Peptide, delta_types: set[DeltaType], i: int):
     '''
-    Generates all possible combinations of deltas for the problem sequence that match the target mass.
+    Gets the deltas of the given types that can happen to residue i of the peptide.
     '''
-    deltas = sorted(deltas, key=lambda x: x.mass, reverse=True)
+    return [delta for delta in get_registry().residue_deltas[peptide.sequence[i]] if delta.type in delta_types and applies_at(peptide, delta.type, i)]
 
-    delta_combinations = []
-    root = tuple([DeltaSet(frozenset(), 0, 0), 0])
-    queue = deque()
-    queue.append(root)
-    max_deletions = 4
-    visited = set()
+def applies_at(peptide: Peptide, delta_type: DeltaType, i: int):
+    '''
+    Checks whether a delta of the given type can occur at residue i of the peptide (or anywhere on it if i is None).
+    '''
+    delta_class = get_registry().delta_classes.get(delta_type)
+    if delta_class is None:
+        return True
+    if delta_class['n_termini'] is not None and peptide.n_termini_species not in delta_class['n_termini']:
+        return False
+    if delta_class['position'] == 'n_terminal_residue':
+        return i == 0
+    if delta_class['position'] == 'c_terminal_residue':
+        return i == len(peptide.sequence) - 1
+    return True
 
-    while queue:
-        curr_node = queue.popleft()
+def get_delta_space(peptide: Peptide, max_deletions: int = 4, delta_types: set[DeltaType] = None):
+    '''
+    Builds the search space of the deltas of the given types for the peptide.
+    '''
+    return DeltaSpace(get_deltas(peptide, delta_types), max_deletions, get_registry().delta_caps)
 
-        # Condition for solution
-        if (target_mass - confidence <= curr_node[0].mass <= target_mass + confidence):
-            delta_combinations.append(curr_node[0])
-        
-        # Termination condtions
-        if len(curr_node[0].deltas) >= max_deletions or curr_node[0].mass >= target_mass + confidence:
-            continue
-        
-        # Continue recursive search
-        for i in range (curr_node[1], len(deltas)):
-            deltas_set = curr_node[0].deltas | frozenset([deltas[i]])
-            if deltas_set in visited: # Don't do duplicate work
-                continue
-            visited.add(deltas_set)
-            next_mass = deltas[i].mass
-            queue.append(tuple([DeltaSet(deltas_set, curr_node[0].mass + next_mass, curr_node[0].likelihood + deltas[i].likelihood), i]))
-    
-    return delta_combinations
-
-def get_truncations(peptide: Peptide, target_mass: float, confidence: float):
-    '''
-    Get all of the N-terminal trucations for the provided peptide without exceeding the target mass.
-    '''
-    residues = json.loads(open('data/residues.json').read())
+def generate_delta_sets(deltas: list[Delta], target_mass: float, confidence: float, max_deletions: int = 4, stats: SearchStats = None):
+    '''
+    Generates all possible combinations of deltas for the problem sequence that match the target mass.
+    '''
+    return DeltaSpace(deltas, max_deletions, get_registry().delta_caps).get_delta_sets(target_mass - confidence, target_mass + confidence, stats)
+
+def build_delta_index(deltas: list[Delta], min_mass: float, max_mass: float, max_deletions: int = 4):
+    '''
+    Builds a mass index of every combination of deltas within the mass window.
+    '''
+    return DeltaIndex(DeltaSpace(deltas, max_deletions, get_registry().delta_caps).get_delta_sets(min_mass, max_mass))
+
+def get_truncations(peptide: Peptide, target_mass: float, confidence: float, min_delta_units: int = 0, prefix_units: list[int] = None):
+    '''
+    Get all of the N-terminal trucations for the provided peptide without exceeding the target mass. min_delta_units is
+    the lightest (most negative) mass, in mass units, that the other deltas can add, which lets heavier truncations be
+    offset. prefix_units, if given, are the masses of the prefixes of the sequence (see PrefixTrie.insert).
+    '''
+    residue_mass_units = get_registry().residue_mass_units
+    max_truncated_units = to_units(target_mass) + to_units(confidence) - min_delta_units
     truncations = [peptide]
-    truncated_mass = 0
+    truncated_units = 0
     for i in range(1, len(peptide.sequence)):
-        truncated_mass += residues[peptide.sequence[i - 1]]['mass']
-        if truncated_mass > target_mass + confidence:
+        truncated_units = prefix_units[i] if prefix_units else truncated_units + residue_mass_units[peptide.sequence[i - 1]]
+        if truncated_units > max_truncated_units:
             break
-        truncations.append(Peptide(peptide.sequence[i:len(peptide.sequence)], peptide.n_termini_species, peptide.c_termini_species, peptide.mass - truncated_mass))
+        truncations.append(Peptide(peptide.sequence[i:len(peptide.sequence)], peptide.n_termini_species, peptide.c_termini_species, from_units(peptide.mass_units - truncated_units)))
     return truncations
 
-def get_solutions(peptide: Peptide, target_mass: float, confidence):
-    solutions = []
-    # TODO: At some point, the most obvious optmization would be to not do the duplicate work of generating the same
-    # delta combinations repeatedly for each of the trucations.
-    truncations = get_truncations(peptide, target_mass, confidence)
+def get_truncation_windows(peptide: Peptide, truncations: list[Peptide], target_mass: float, confidence: float):
+    '''
+    Gets the target mass of the other deltas for every truncation and its window of +/- confidence, in mass units.
+    '''
+    target_units, confidence_units = to_units(target_mass), to_units(confidence)
+    truncation_target_units = [target_units - (peptide.mass_units - truncation.mass_units) for truncation in truncations]
+    return truncation_target_units, [MassWindows([(units - confidence_units, units + confidence_units)]) for units in truncation_target_units]
+
+def get_truncation_delta(peptide: Peptide, truncation: Peptide):
+    '''
+    Gets the delta for the residues missing from the N-terminus of the truncation.
+    '''
+    return Delta(from_units(peptide.mass_units - truncation.mass_units), DeltaType.TRUNCATION, 1, f"truncation of \'{peptide.sequence[:len(peptide.sequence) - len(truncation.sequence)]}\'")
 
+def get_truncation_limits(peptide: Peptide, truncations: list[Peptide], delta_types: set[DeltaType] = None):
+    '''
+    Gets, for every truncation, the deltas of residues that it removes some of, mapped to how many of them are left.
+    The search space is shared by every truncation of a peptide, so a combination of deltas found for a truncation is
+    only a solution if it fits the truncation's limits (see fits_truncation).
+    '''
+    counts = Counter(get_deltas(peptide, delta_types))
+    delta_types = {DeltaType.DELETION} if delta_types is None else delta_types
+    left = counts.copy()
+    limits = []
+    truncated = 0
     for truncation in truncations:
-        deltas = get_deltas(peptide)
-        for delta_combination in generate_delta_sets(deltas, target_mass - (peptide.mass - truncation.mass), confidence):
-            if truncation.mass < (peptide.mass - .01):
-                solutions.append(DeltaSet(delta_combination.deltas | frozenset([Delta(peptide.mass - truncation.mass, DeltaType.TRUNCATION, 1, f"truncation of \'{peptide.sequence[:len(peptide.sequence) - len(truncation.sequence)]}\'")])))
-            else:
-                solutions.append(DeltaSet(delta_combination.deltas))
-    
-    return sorted(solutions, key=lambda x: x.likelihood)
\ No newline at end of file
+        while truncated < len(peptide.sequence) - len(truncation.sequence):
+            left.subtract(get_residue_deltas(peptide, delta_types, truncated))
+            truncated += 1
+        limits.append({delta: left[delta] for delta in counts if left[delta] < counts[delta]})
+    return limits
+
+def fits_truncation(limits: dict[Delta, int], delta_combination: DeltaSet):
+    '''
+    Checks whether a combination of deltas only changes residues that are left by a truncation with the given limits.
+    '''
+    if not limits:
+        return True
+    counts = {}
+    for delta in delta_combination.deltas:
+        if delta in limits:
+            counts[delta] = counts.get(delta, 0) + 1
+            if counts[delta] > limits[delta]:
+                return False
+    return True
+
+def add_truncation(peptide: Peptide, truncation: Peptide, delta_combination: DeltaSet):
+    '''
+    Gets the solution for a combination of deltas found for a truncation of the peptide.
+    '''
+    if len(truncation.sequence) < len(peptide.sequence):
+        truncation_delta = get_truncation_delta(peptide, truncation)
+        return DeltaSet(delta_combination.deltas + (truncation_delta,), from_units(delta_combination.mass_units + truncation_delta.mass_units), delta_combination.likelihood + truncation_delta.likelihood)
+    return delta_combination
+
+def get_solutions(peptide: Peptide, target_mass: float, confidence, max_deletions: int = 4, top_k: int = None, stats: SearchStats = None, delta_types: set[DeltaType] = None, mass_table: MassTable = None, delta_space: DeltaSpace = None):
+    '''
+    Gets every solution (or the top_k most likely) sorted by likelihood. With a profiling stats, the peak resident set
+    size after the query is recorded in it too.
+    '''
+    if top_k is not None and mass_table is not None:
+        raise ValueError('The mass table only answers exhaustive searches, not top_k')
+    with track_rss(stats):
+        if top_k is not None:
+            return list(iter_top_solutions(peptide, target_mass, confidence, top_k, max_deletions, stats, delta_types, delta_space))
+        if mass_table is not None:
+            return sorted(iter_table_solutions(peptide, target_mass, confidence, mass_table, max_deletions, stats, delta_types), key=lambda x: x.likelihood)
+
+        return sorted(iter_solutions(peptide, target_mass, confidence, max_deletions, stats, delta_types, delta_space), key=lambda x: x.likelihood)
+
+def iter_solutions(peptide: Peptide, target_mass: float, confidence, max_deletions: int = 4, stats: SearchStats = None, delta_types: set[DeltaType] = None, delta_space: DeltaSpace = None):
+    '''
+    Generates the solutions as they are found, truncation by truncation, without holding them in memory. If stats has a
+    node budget, the search stops when it runs out and stats.partial is set. A delta_space built earlier by
+    get_delta_space for the same peptide, max_deletions and delta_types can be passed to skip building it again.
+    '''
+    # The deltas are the same for every truncation, so the search space is built once and each truncation only
+    # searches its own mass window. With bound pruning this is cheaper than indexing the union of all the windows.
+    with time_stage(stats, 'delta_space'):
+        delta_space = delta_space or get_delta_space(peptide, max_deletions, delta_types)
+    with time_stage(stats, 'truncations'):
+        truncations = get_truncations(peptide, target_mass, confidence, delta_space.min_units)
+        _, truncation_windows = get_truncation_windows(peptide, truncations, target_mass, confidence)
+        truncation_limits = get_truncation_limits(peptide, truncations, delta_types)
+
+    profile = is_profiling(stats)
+    found = 0
+    try:
+        for truncation, windows, limits in zip(truncations, truncation_windows, truncation_limits):
+            if profile:
+                start, nodes_expanded, truncation_found = time.perf_counter(), stats.nodes_expanded, found
+            for composition, mass, likelihood in delta_space.iter_compositions(windows, stats):
+                delta_combination = delta_space.to_delta_set(composition, mass, likelihood)
+                if fits_truncation(limits, delta_combination):
+                    found += 1
+                    yield add_truncation(peptide, truncation, delta_combination)
+            if profile:
+                seconds = time.perf_counter() - start
+                stats.timings['search'] = stats.timings.get('search', 0) + seconds
+                stats.add_truncation(len(peptide.sequence) - len(truncation.sequence), seconds, stats.nodes_expanded - nodes_expanded, found - truncation_found)
+    finally:
+        if stats is not None:
+            stats.solutions += found
+
+def iter_table_solutions(peptide: Peptide, target_mass: float, confidence, mass_table: MassTable, max_deletions: int = 4, stats: SearchStats = None, delta_types: set[DeltaType] = None):
+    '''
+    Generates the same solutions in the same order as iter_solutions, but answers each truncation's window by binary
+    searching the precomputed mass table (see scripts/generate_mass_combinations.py) and keeping the compositions the
+    peptide can supply, instead of searching. Only deletions are in the table.
+    '''
+    if delta_types is not None and set(delta_types) != {DeltaType.DELETION}:
+        raise ValueError('The mass table only holds deletions')
+    if max_deletions > mass_table.max_deletions:
+        raise ValueError(f'The mass table only holds up to {mass_table.max_deletions} deletions')
+    if mass_table.data_hash != get_registry().data_hash:
+        raise ValueError(f"The mass table '{mass_table.path}' was built from other residue tables")
+
+    # The space is only built for its order of kinds and their counts, so that compositions from the table are turned
+    # into the same DeltaSets in the same order as a search would give
+    delta_space = get_delta_space(peptide, max_deletions)
+    kinds = {delta.description: i for i, delta in enumerate(delta_space.deltas)}
+    truncations = get_truncations(peptide, target_mass, confidence, delta_space.min_units)
+    _, truncation_windows = get_truncation_windows(peptide, truncations, target_mass, confidence)
+    truncation_limits = get_truncation_limits(peptide, truncations)
+
+    found = 0
+    try:
+        for truncation, windows, limits in zip(truncations, truncation_windows, truncation_limits):
+            compositions = []
+            for mass, residues in mass_table.query_units(windows.min_mass, windows.max_mass):
+                if len(residues) > max_deletions or any(residue not in kinds for residue in residues):
+                    continue
+                composition = tuple(sorted(kinds[residue] for residue in residues))
+                if all(composition.count(i) <= delta_space.counts[i] for i in set(composition)):
+                    compositions.append((composition, mass))
+            for composition, mass in sorted(compositions):
+                delta_combination = delta_space.to_delta_set(composition, mass)
+                if fits_truncation(limits, delta_combination):
+                    found += 1
+                    yield add_truncation(peptide, truncation, delta_combination)
+    finally:
+        if stats is not None:
+            stats.solutions += found
+
+def iter_top_solutions(peptide: Peptide, target_mass: float, confidence, top_k: int, max_deletions: int = 4, stats: SearchStats = None, delta_types: set[DeltaType] = None, delta_space: DeltaSpace = None):
+    '''
+    Generates the top_k most likely solutions, ordered by likelihood and then by mass error.
+
+    Candidates from every truncation are expanded best first from a heap. Adding a delta never lowers the likelihood,
+    so a solution is yielded as soon as it reaches the top of the heap and the search stops once top_k are found (or
+    the node budget of stats runs out, which sets stats.partial).
+    '''
+    with time_stage(stats, 'delta_space'):
+        delta_space = delta_space or get_delta_space(peptide, max_deletions, delta_types)
+    with time_stage(stats, 'truncations'):
+        truncations = get_truncations(peptide, target_mass, confidence, delta_space.min_units)
+        truncation_target_units, truncation_windows = get_truncation_windows(peptide, truncations, target_mass, confidence)
+        truncation_limits = get_truncation_limits(peptide, truncations, delta_types)
+
+    # Heap entries are (likelihood, mass error, tie breaker, truncation index, node, solution). Nodes are pushed with a
+    # mass error of 0 so that they are expanded before any solution with the same likelihood is yielded.
+    heap = []
+    counter = itertools.count()
+    for t, truncation in enumerate(truncations):
+        if delta_space.can_reach(truncation_windows[t]):
+            truncation_likelihood = 1 if len(truncation.sequence) < len(peptide.sequence) else 0
+            heap.append((truncation_likelihood, 0, next(counter), t, DeltaSpace.ROOT, None))
+    heapq.heapify(heap)
+
+    profile = is_profiling(stats)
+    found = 0
+    while heap and found < top_k:
+        likelihood, _, _, t, node, solution = heapq.heappop(heap)
+        if solution is not None:
+            found += 1
+            if stats is not None:
+                stats.solutions += 1
+            yield solution
+            continue
+
+        if stats is not None:
+            if stats.get_remaining_nodes() == 0:
+                stats.partial = True
+                return
+            stats.nodes_expanded += 1
+            if profile:
+                stats.max_stack = max(stats.max_stack, len(heap) + 1)
+
+        # Only the top_k best completions of a node can ever be yielded, so the rest are never turned into solutions
+        node_likelihood = node[2]
+        completions = delta_space.get_completions(node, truncation_windows[t])
+        if truncation_limits[t]:
+            # Completions that need residues the truncation removed are dropped before the best are kept
+            completions = [x for x in completions if fits_truncation(truncation_limits[t], delta_space.to_delta_set(*x))]
+        if len(completions) > top_k:
+            completions = heapq.nsmallest(top_k, completions, key=lambda x: (x[2], abs(x[1] - truncation_target_units[t])))
+        for composition, mass, composition_likelihood in completions:
+            solution = add_truncation(peptide, truncations[t], delta_space.to_delta_set(composition, mass, composition_likelihood))
+            heapq.heappush(heap, (likelihood - node_likelihood + composition_likelihood, abs(mass - truncation_target_units[t]), next(counter), t, None, solution))
+
+        for child in delta_space.get_children(node, truncation_windows[t]):
+            heapq.heappush(heap, (likelihood - node_likelihood + child[2], 0, next(counter), t, child, None))
+
+def get_positions(peptide: Peptide, delta: Delta, start: int = 0):
+    '''
+    Gets every position from start onwards of a residue that the delta could have happened to, or None if the delta is
+    not tied to a residue.
+    '''
+    registry = get_registry()
+    if delta.type == DeltaType.TRUNCATION or registry.delta_classes.get(delta.type, {}).get('position') == 'peptide':
+        return None
+    return tuple(i for i in range(start, len(peptide.sequence)) if delta in registry.residue_deltas[peptide.sequence[i]] and applies_at(peptide, delta.type, i))
+
+def group_solution(peptide: Peptide, solution: DeltaSet):
+    '''
+    Gets the solution as a SolutionGroup with the positions each of its deltas of residues could be at. Residues lost
+    to a truncation cannot also be deleted or modified, so their positions are left out.
+    '''
+    # Every prefix of the sequence has its own mass, so the number of residues truncated is found from the truncation's
+    truncation_units = sum(delta.mass_units for delta in solution.deltas if delta.type == DeltaType.TRUNCATION)
+    residue_mass_units = get_registry().residue_mass_units
+    truncated = truncated_units = 0
+    while truncated_units < truncation_units:
+        truncated_units += residue_mass_units[peptide.sequence[truncated]]
+        truncated += 1
+    positions = {}
+    for delta in solution.deltas:
+        if delta not in positions:
+            delta_positions = get_positions(peptide, delta, truncated)
+            if delta_positions is not None:
+                positions[delta] = delta_positions
+    return SolutionGroup(solution, positions, truncated)
+
+def get_multi_peak_solutions(peptide: Peptide, peaks: list[tuple[float, float]], max_deletions: int = 4, stats: SearchStats = None, delta_types: set[DeltaType] = None):
+    '''
+    Gets the solutions for every (observed mass, confidence) peak of the peptide, as one list per peak that matches
+    get_solutions for that peak.
+
+    The combinations of deltas for every peak and truncation are searched once, pruning against the union of their
+    windows, and indexed by mass so that each peak and truncation is answered with a range query.
+    '''
+    delta_space = get_delta_space(peptide, max_deletions, delta_types)
+    queries = []
+    for observed_mass, confidence in peaks:
+        target_mass = peptide.mass - observed_mass
+        truncations = get_truncations(peptide, target_mass, confidence, delta_space.min_units)
+        queries.append((truncations, get_truncation_windows(peptide, truncations, target_mass, confidence)[1]))
+
+    windows = MassWindows([(window.min_mass, window.max_mass) for _, truncation_windows in queries for window in truncation_windows])
+    index = DeltaIndex(delta_space.get_window_delta_sets(windows, stats))
+
+    peak_solutions = []
+    for truncations, truncation_windows in queries:
+        solutions = []
+        for truncation, window, limits in zip(truncations, truncation_windows, get_truncation_limits(peptide, truncations, delta_types)):
+            for delta_combination in index.query_units(window.min_mass, window.max_mass):
+                if fits_truncation(limits, delta_combination):
+                    solutions.append(add_truncation(peptide, truncation, delta_combination))
+        if stats is not None:
+            stats.solutions += len(solutions)
+        peak_solutions.append(sorted(solutions, key=lambda x: x.likelihood))
+
+    return peak_solutions
@@ -0,0 +1,30 @@
+from bisect import bisect_left, bisect_right
+from source.delta_set import DeltaSet
+from source.mass_units import to_units
+
+class DeltaIndex:
+    def __init__(self, delta_sets: list[DeltaSet]):
+        '''
+        Indexes delta combinations by total mass so that a mass window can be answered with a range query
+        instead of a fresh search. Combinations are returned in the order they were provided.
+        '''
+        self.delta_sets = delta_sets
+        self.order = sorted(range(len(delta_sets)), key=lambda i: delta_sets[i].mass_units)
+        self.mass_units = [delta_sets[i].mass_units for i in self.order]
+
+    def query(self, min_mass: float, max_mass: float):
+        '''
+        Gets all of the indexed delta combinations with min_mass <= mass <= max_mass.
+        '''
+        return self.query_units(to_units(min_mass), to_units(max_mass))
+
+    def query_units(self, min_units: int, max_units: int):
+        '''
+        Gets all of the indexed delta combinations with min_units <= mass <= max_units, in integer mass units.
+        '''
+        start = bisect_left(self.mass_units, min_units)
+        end = bisect_right(self.mass_units, max_units)
+        return [self.delta_sets[i] for i in sorted(self.order[start:end])]
+
+    def __len__(self):
+        return len(self.delta_sets)
@@ -1,15 +1,21 @@
 from source.delta import Delta
+from source.mass_units import from_units, to_units
 
 class DeltaSet:
-    def __init__(self, deltas: frozenset[Delta], mass: float = None, likelihood: int = None):
+    __slots__ = ('deltas', 'ids', 'mass_units', 'mass', 'likelihood')
+
+    def __init__(self, deltas: tuple[Delta, ...], mass: float = None, likelihood: int = None):
         self.deltas = deltas
-        self.mass = mass if mass else self.calculate_mass()
+        # The sorted ids of the (interned) deltas identify the combination regardless of the order of the deltas
+        self.ids = tuple(sorted(delta.id for delta in deltas))
+        self.mass_units = to_units(mass) if mass else self.calculate_mass_units()
+        self.mass = from_units(self.mass_units)
         self.likelihood = likelihood if likelihood else self.calculate_likelihood()
     
-    def calculate_mass(self):
+    def calculate_mass_units(self):
         total_mass = 0
         for delta in self.deltas:
-            total_mass += delta.mass
+            total_mass += delta.mass_units
 
         return total_mass
     
@@ -20,11 +26,22 @@ class DeltaSet:
         
         return likelihood
 
+    def __reduce__(self):
+        # Ids are only meaningful within a process, so they are recomputed from the unpickled deltas
+        return (DeltaSet, (self.deltas, self.mass, self.likelihood))
+
+    def to_dict(self):
+        return {'mass': self.mass, 'likelihood': self.likelihood, 'deltas': [delta.to_dict() for delta in self.deltas]}
+
+    @classmethod
+    def from_dict(cls, delta_set: dict):
+        return cls(tuple(Delta.from_dict(delta) for delta in delta_set['deltas']), delta_set['mass'], delta_set['likelihood'])
+
     def __hash__(self):
-        return hash(self.deltas)
+        return hash(self.ids)
     
     def __eq__(self, other):
-        return hash(self.deltas) == hash(other.deltas) and self.mass == other.mass  
+        return isinstance(other, DeltaSet) and self.ids == other.ids
     
     def __repr__(self):
-        return f"DeltaSet(mass={self.mass}, deltas='{self.deltas}')"
\ No newline at end of file
+        return f"DeltaSet(mass={self.mass}, deltas='{self.deltas}')"
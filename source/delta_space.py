@@ -0,0 +1,222 @@
+import bisect
+from source.delta import Delta, DeltaType
+from source.delta_set import DeltaSet
+from source.mass_units import from_units, to_units
+from source.mass_windows import MassWindows
+from source.reachable_masses import ReachableMasses
+from source.search_stats import SearchStats, is_profiling
+
+class DeltaSpace:
+    # The node of the empty composition, where every search starts
+    ROOT = ((), 0, 0, 0, 0)
+
+    def __init__(self, deltas: list[Delta], max_deletions: int = 4, caps: dict[DeltaType, int] = None):
+        '''
+        Groups the deltas of a peptide into distinct kinds and the number of times each kind occurs, so that combinations
+        are searched as counts of each kind rather than as sets of individual residues. Deletions are capped at
+        max_deletions and every other type of delta at its entry in caps (or max_deletions if it has none).
+
+        All masses in the search are integer mass units (see source.mass_units), so windows are given in mass units too.
+        '''
+        if max_deletions < 0:
+            raise ValueError(f'max_deletions must not be negative, not {max_deletions}')
+        counts = {}
+        for delta in deltas:
+            counts[delta] = counts.get(delta, 0) + 1
+
+        # Kinds are grouped into one block per type and sorted by mass within each block, so a composition only needs
+        # to track the cap that is left for the block it is currently taking deltas from
+        caps = caps or {}
+        types = list(DeltaType)
+        self.deltas = sorted(counts, key=lambda x: (types.index(x.type), -x.mass))
+        self.counts = [counts[delta] for delta in self.deltas]
+        self.masses = [delta.mass_units for delta in self.deltas]
+        self.caps = [max_deletions if delta.type == DeltaType.DELETION else caps.get(delta.type, max_deletions) for delta in self.deltas]
+        self.max_deletions = max_deletions
+
+        # max_gains[i][r] and min_gains[i][r] bound the mass that can be added by up to r more deltas from the block of
+        # self.deltas[i] (starting at i) together with any deltas from the blocks after it
+        self.max_gains = [None] * len(self.deltas) + [[0]]
+        self.min_gains = [None] * len(self.deltas) + [[0]]
+        later_max_gain = later_min_gain = 0
+        block_end = len(self.deltas)
+        for i in reversed(range(len(self.deltas))):
+            if i + 1 < len(self.deltas) and self.deltas[i + 1].type != self.deltas[i].type:
+                later_max_gain = self.max_gains[i + 1][self.caps[i + 1]]
+                later_min_gain = self.min_gains[i + 1][self.caps[i + 1]]
+                block_end = i + 1
+            masses = []
+            for mass, count in zip(self.masses[i:block_end], self.counts[i:block_end]):
+                masses += [mass] * min(count, self.caps[i])
+            positives = [mass for mass in masses if mass > 0]
+            negatives = [mass for mass in reversed(masses) if mass < 0]
+            self.max_gains[i] = [later_max_gain + sum(positives[:r]) for r in range(self.caps[i] + 1)]
+            self.min_gains[i] = [later_min_gain + sum(negatives[:r]) for r in range(self.caps[i] + 1)]
+
+        # Only the first block is searched depth first. Deltas of mixed signs in the later blocks leave the bounds too
+        # loose to prune with, so every combination of them is enumerated once and sorted by mass, and each node of the
+        # first block is completed with a range query.
+        self.first_block_end = len(self.deltas)
+        for i in range(1, len(self.deltas)):
+            if self.deltas[i].type != self.deltas[0].type:
+                self.first_block_end = i
+                break
+        self.tail = self.tail_masses = None
+        if self.first_block_end < len(self.deltas):
+            self.tail = sorted(self.iter_tail(), key=lambda x: x[1])
+            self.tail_masses = [mass for _, mass, _ in self.tail]
+        self.reachable = None
+
+    def iter_tail(self):
+        '''
+        Generates every composition of the blocks after the first as a (composition, mass, likelihood) tuple.
+        '''
+        stack = [self.ROOT]
+        while stack:
+            composition, mass, likelihood, used, remaining = stack.pop()
+            yield composition, mass, likelihood
+            start = composition[-1] if composition else self.first_block_end
+            for i in range(start, len(self.deltas)):
+                cap = remaining if composition and self.deltas[i].type == self.deltas[start].type else self.caps[i]
+                count = used + 1 if composition and i == start else 1
+                if cap > 0 and count <= self.counts[i]:
+                    stack.append((composition + (i,), mass + self.masses[i], likelihood + self.deltas[i].likelihood, count, cap - 1))
+
+    @property
+    def min_units(self):
+        '''
+        The lightest mass of any composition.
+        '''
+        return self.min_gains[0][self.caps[0]] if self.deltas else 0
+
+    @property
+    def max_units(self):
+        '''
+        The heaviest mass of any composition.
+        '''
+        return self.max_gains[0][self.caps[0]] if self.deltas else 0
+
+    def get_reachable(self):
+        '''
+        Builds the bitset of reachable masses the first time it is needed.
+        '''
+        if self.reachable is None:
+            blocks = {}
+            for i, (mass, count) in enumerate(zip(self.masses, self.counts)):
+                blocks.setdefault(self.deltas[i].type, (self.caps[i], []))[1].append((mass, count))
+            self.reachable = ReachableMasses(list(blocks.values()))
+        return self.reachable
+
+    def can_reach(self, windows: MassWindows):
+        '''
+        Checks whether any composition could have a mass within the windows, first against the bounds of the whole space
+        and then against the bitset of reachable masses, so that a window with no explanation is rejected before any
+        enumeration starts.
+        '''
+        return windows.overlaps(self.min_units, self.max_units) and self.get_reachable().reaches(windows)
+
+    def iter_compositions(self, windows: MassWindows, stats: SearchStats = None, root: tuple = ROOT):
+        '''
+        Generates every composition whose mass is within the windows as a (composition, mass, likelihood) tuple, where a
+        composition is a non-decreasing tuple of indices into self.deltas. Compositions are visited depth first in
+        index order, so every composition is reached exactly once and no visited set is needed, and memory only grows
+        with the depth of the search. The search stops early when the node budget of stats runs out.
+
+        Only the subtree of root is searched, so the children of a node can be searched separately and their results
+        concatenated in index order to get the same compositions in the same order.
+        '''
+        if not self.can_reach(windows):
+            return
+
+        min_mass, max_mass = windows.min_mass, windows.max_mass
+        disjoint = len(windows) > 1
+        max_nodes = None if stats is None else stats.get_remaining_nodes()
+        profile = is_profiling(stats)
+        stack = [root]
+        nodes_expanded = 0
+        try:
+            while stack:
+                if nodes_expanded == max_nodes:
+                    stats.partial = True
+                    return
+                if profile:
+                    stats.max_stack = max(stats.max_stack, len(stack))
+                node = stack.pop()
+                nodes_expanded += 1
+
+                if self.tail is not None:
+                    yield from self.get_completions(node, windows)
+                elif min_mass <= node[1] <= max_mass and (not disjoint or windows.contains(node[1])):
+                    yield node[:3]
+
+                children = self.get_children(node, windows)
+                if profile:
+                    # Every kind from the node's last one to the end of the first block is a branch, unless it was pruned
+                    stats.branches_pruned += self.first_block_end - (node[0][-1] if node[0] else 0) - len(children)
+                # Reversed so that children are popped in index order
+                stack.extend(reversed(children))
+        finally:
+            if stats is not None:
+                stats.nodes_expanded += nodes_expanded
+
+    def get_completions(self, node: tuple, windows: MassWindows):
+        '''
+        Gets the compositions within the windows that complete the node's composition of the first block with a
+        composition of the later blocks (or none), as (composition, mass, likelihood) tuples.
+        '''
+        composition, mass, likelihood = node[:3]
+        disjoint = len(windows) > 1
+        if self.tail is None:
+            if windows.min_mass <= mass <= windows.max_mass and (not disjoint or windows.contains(mass)):
+                return [(composition, mass, likelihood)]
+            return []
+
+        completions = []
+        start = bisect.bisect_left(self.tail_masses, windows.min_mass - mass)
+        end = bisect.bisect_right(self.tail_masses, windows.max_mass - mass)
+        for tail_composition, tail_mass, tail_likelihood in self.tail[start:end]:
+            if not disjoint or windows.contains(mass + tail_mass):
+                completions.append((composition + tail_composition, mass + tail_mass, likelihood + tail_likelihood))
+        return completions
+
+    def get_children(self, node: tuple, windows: MassWindows):
+        '''
+        Gets the nodes that add one more delta of the first block to the node's composition and can still reach the
+        windows, in index order. A node is (composition, mass, likelihood, used, remaining), where used is the number of
+        times the last delta of the composition has been taken and remaining is the cap left for the first block.
+        '''
+        composition, mass, likelihood, used, remaining = node
+        min_mass, max_mass = windows.min_mass, windows.max_mass
+        disjoint = len(windows) > 1
+        start = composition[-1] if composition else 0
+        children = []
+        for i in range(start, self.first_block_end):
+            cap = remaining if composition else self.caps[i]
+            if mass + self.max_gains[i][cap] < min_mass:
+                break # Every later delta is lighter, so none of them can reach the windows either
+            count = used + 1 if composition and i == start else 1
+            if cap == 0 or count > self.counts[i]:
+                continue
+            next_mass = mass + self.masses[i]
+            max_gain, min_gain = self.max_gains[i][cap - 1], self.min_gains[i][cap - 1]
+            if next_mass + max_gain < min_mass or next_mass + min_gain > max_mass:
+                continue
+            if disjoint and not windows.overlaps(next_mass + min_gain, next_mass + max_gain):
+                continue
+            children.append((composition + (i,), next_mass, likelihood + self.deltas[i].likelihood, count, cap - 1))
+        return children
+
+    def to_delta_set(self, composition: tuple[int, ...], mass_units: int = None, likelihood: int = None):
+        return DeltaSet(tuple(self.deltas[i] for i in composition), None if mass_units is None else from_units(mass_units), likelihood)
+
+    def get_delta_sets(self, min_mass: float, max_mass: float, stats: SearchStats = None):
+        '''
+        Gets every combination of deltas whose mass (in daltons) is within the window.
+        '''
+        return self.get_window_delta_sets(MassWindows([(to_units(min_mass), to_units(max_mass))]), stats)
+
+    def get_window_delta_sets(self, windows: MassWindows, stats: SearchStats = None):
+        '''
+        Gets every combination of deltas whose mass is within any of the windows, given in mass units.
+        '''
+        return [self.to_delta_set(composition, mass, likelihood) for composition, mass, likelihood in self.iter_compositions(windows, stats)]
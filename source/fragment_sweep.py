@@ -0,0 +1,59 @@
+import numpy as np
+from source.mass_units import to_units
+from source.peptide import Peptide
+from source.registry import get_registry
+
+# Lookup table from the ascii code of a residue symbol to the residue's mass in mass units, or -1 for unknown symbols
+RESIDUE_MASS_UNITS = np.full(256, -1, dtype=np.int64)
+for symbol, mass_units in get_registry().residue_mass_units.items():
+    RESIDUE_MASS_UNITS[ord(symbol)] = mass_units
+
+def encode_sequence(sequence: str):
+    '''
+    Encodes a sequence as an array of residue symbol codes.
+    '''
+    return np.frombuffer(sequence.encode('ascii'), dtype=np.uint8)
+
+def get_prefix_units(sequence: str):
+    '''
+    Gets the cumulative residue masses of the sequence in mass units, where prefix_units[i] is the mass of sequence[:i].
+    '''
+    residue_units = RESIDUE_MASS_UNITS[encode_sequence(sequence)]
+    if (residue_units < 0).any():
+        raise ValueError(f"Unknown residue in sequence '{sequence}'")
+    prefix_units = np.zeros(len(sequence) + 1, dtype=np.int64)
+    np.cumsum(residue_units, out=prefix_units[1:])
+    return prefix_units
+
+def get_fragments(peptide: Peptide, target_mass: float, confidence: float, n_terminal=True, c_terminal=True, internal=True):
+    '''
+    Gets every fragment of the peptide whose missing residues weigh target_mass +/- confidence, as (start, end) windows
+    of the remaining sequence[start:end]. N-terminal truncations end at the C-terminus, C-terminal truncations start at
+    the N-terminus and internal fragments do neither.
+    '''
+    prefix_units = get_prefix_units(peptide.sequence)
+    length = len(peptide.sequence)
+    total_units = prefix_units[-1]
+    target_units, confidence_units = to_units(target_mass), to_units(confidence)
+
+    # The missing mass of sequence[start:end] is prefix_units[start] + total_units - prefix_units[end], so for every
+    # start the matching ends are a contiguous range of the (strictly increasing) prefix masses.
+    starts = np.arange(length)
+    first_ends = np.searchsorted(prefix_units, prefix_units[:-1] + total_units - target_units - confidence_units, side='left')
+    last_ends = np.searchsorted(prefix_units, prefix_units[:-1] + total_units - target_units + confidence_units, side='right')
+    first_ends = np.maximum(first_ends, starts + 1)
+    counts = np.maximum(last_ends - first_ends, 0)
+
+    fragment_starts = np.repeat(starts, counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    fragment_ends = np.repeat(first_ends, counts) + offsets
+
+    keep = np.zeros(len(fragment_starts), dtype=bool)
+    if n_terminal:
+        keep |= (fragment_starts > 0) & (fragment_ends == length)
+    if c_terminal:
+        keep |= (fragment_starts == 0) & (fragment_ends < length)
+    if internal:
+        keep |= (fragment_starts > 0) & (fragment_ends < length)
+
+    return list(zip(fragment_starts[keep].tolist(), fragment_ends[keep].tolist()))
@@ -0,0 +1,80 @@
+from collections import Counter
+from source import delta_finder
+from source.delta import DeltaType
+from source.delta_index import DeltaIndex
+from source.delta_space import DeltaSpace
+from source.mass_units import from_units
+from source.mass_windows import MassWindows
+from source.peptide import Peptide
+from source.prefix_trie import PrefixTrie
+from source.registry import get_registry
+from source.search_stats import SearchStats
+
+def get_library_peptides(sequences: list[tuple[str, str, str]], trie: PrefixTrie = None):
+    '''
+    Gets the Peptide of every (sequence, n_terminus, c_terminus) together with the masses of its prefixes, adding the
+    sequences to a shared prefix trie so that variants with a common prefix add up its mass once.
+    '''
+    registry = get_registry()
+    trie = trie or PrefixTrie()
+    peptides = []
+    for sequence, n_terminus, c_terminus in sequences:
+        prefix_units = trie.insert(sequence)
+        mass_units = prefix_units[-1] + registry.termini_species_mass_units[n_terminus] + registry.termini_species_mass_units[c_terminus]
+        peptides.append((Peptide(sequence, n_terminus, c_terminus, from_units(mass_units)), prefix_units))
+    return peptides
+
+def get_library_solutions(samples: list[tuple[str, str, str, float, float]], max_deletions: int = 4, stats: SearchStats = None, delta_types: set[DeltaType] = None):
+    '''
+    Gets the solutions of every (sequence, n_terminus, c_terminus, observed mass, confidence) sample of a library of
+    related sequences, as one list per sample sorted by likelihood. Each list holds the same solutions as
+    delta_finder.get_solutions finds for the sample, but solutions of equal likelihood, and the deltas within each
+    solution, may come in a different order.
+
+    Instead of one search per sample, the library is searched once: the deltas of every sequence are merged into one
+    space with the most of each kind that any sequence has, the space is searched against the union of every sample's
+    truncation windows and indexed by mass, and each sample keeps the combinations in its windows that its own sequence
+    can supply. Sequences that differ at a few positions share almost every combination, so the library costs little
+    more than its largest member.
+    '''
+    peptides = get_library_peptides([sample[:3] for sample in samples])
+
+    # The kinds of deltas of every distinct sequence (and of what is left of it after each truncation), and the most of
+    # each kind that any of them has
+    sequence_counts = {}
+    max_counts = Counter()
+    for peptide, _ in peptides:
+        key = (peptide.sequence, peptide.n_termini_species, peptide.c_termini_species, 0)
+        if key not in sequence_counts:
+            sequence_counts[key] = Counter(delta_finder.get_deltas(peptide, delta_types))
+            max_counts |= sequence_counts[key]
+    delta_space = DeltaSpace(list(max_counts.elements()), max_deletions, get_registry().delta_caps)
+
+    queries = []
+    for (peptide, prefix_units), (_, _, _, observed_mass, confidence) in zip(peptides, samples):
+        target_mass = peptide.mass - observed_mass
+        # The shared space can add at least as little mass as any sequence's own, so no truncation is missed
+        truncations = delta_finder.get_truncations(peptide, target_mass, confidence, delta_space.min_units, prefix_units)
+        queries.append((truncations, delta_finder.get_truncation_windows(peptide, truncations, target_mass, confidence)[1]))
+
+    windows = MassWindows([(window.min_mass, window.max_mass) for _, truncation_windows in queries for window in truncation_windows])
+    index = DeltaIndex(delta_space.get_window_delta_sets(windows, stats))
+
+    library_solutions = []
+    for (peptide, _), (truncations, truncation_windows) in zip(peptides, queries):
+        solutions = []
+        for truncation, window in zip(truncations, truncation_windows):
+            # Only the residues left by the truncation can be deleted or modified
+            truncated = len(peptide.sequence) - len(truncation.sequence)
+            key = (peptide.sequence, peptide.n_termini_species, peptide.c_termini_species, truncated)
+            if key not in sequence_counts:
+                sequence_counts[key] = Counter(delta_finder.get_deltas(peptide, delta_types, truncated))
+            counts = sequence_counts[key]
+            for delta_combination in index.query_units(window.min_mass, window.max_mass):
+                if all(counts[delta] >= count for delta, count in Counter(delta_combination.deltas).items()):
+                    solutions.append(delta_finder.add_truncation(peptide, truncation, delta_combination))
+        if stats is not None:
+            stats.solutions += len(solutions)
+        library_solutions.append(sorted(solutions, key=lambda x: x.likelihood))
+
+    return library_solutions
@@ -0,0 +1,101 @@
+import bisect
+import functools
+import itertools
+import json
+import mmap
+import os
+import struct
+from source.delta import DeltaType
+from source.registry import DATA_DIRECTORY, Registry
+
+MASS_TABLE_PATH = os.path.join(DATA_DIRECTORY, 'mass-combinations.bin')
+MAGIC = b'MASSTBL1'
+# Marks the unused slots of a composition with fewer than max_deletions residues
+EMPTY = 255
+
+class MassTable:
+    def __init__(self, path: str = MASS_TABLE_PATH):
+        '''
+        A memory-mapped table of every multiset of up to max_deletions residues, sorted by mass, as written by
+        write_mass_table. Opening it only maps the file, so worker processes share its pages through the page cache.
+
+        The file is the magic, the length of a JSON header, the header (padded to 8 bytes), the masses of the rows in
+        mass units (native int64, so a table is built on the machine that uses it) and then the compositions of the
+        rows, max_deletions bytes each, as indices into the alphabet of the header.
+        '''
+        self.path = path
+        with open(path, 'rb') as file:
+            self.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"'{path}' is not a mass table")
+        header_length, = struct.unpack_from('<I', self.mmap, len(MAGIC))
+        header_start = len(MAGIC) + 4
+        header = json.loads(self.mmap[header_start:header_start + header_length])
+        self.data_hash = header['data_hash']
+        self.alphabet = header['alphabet']
+        self.max_deletions = header['max_deletions']
+        self.rows = header['rows']
+
+        masses_start = get_masses_start(header_length)
+        self.compositions_start = masses_start + 8 * self.rows
+        self.mass_units = memoryview(self.mmap)[masses_start:self.compositions_start].cast('q')
+
+    def get_composition(self, row: int):
+        '''
+        Gets the residue symbols of a row, heaviest first.
+        '''
+        start = self.compositions_start + row * self.max_deletions
+        return tuple(self.alphabet[i] for i in self.mmap[start:start + self.max_deletions] if i != EMPTY)
+
+    def query_units(self, min_units: int, max_units: int):
+        '''
+        Generates every (mass units, composition) row with min_units <= mass <= max_units, lightest first.
+        '''
+        start = bisect.bisect_left(self.mass_units, min_units)
+        end = bisect.bisect_right(self.mass_units, max_units)
+        for row in range(start, end):
+            yield self.mass_units[row], self.get_composition(row)
+
+    def __len__(self):
+        return self.rows
+
+def get_masses_start(header_length: int):
+    return -(-(len(MAGIC) + 4 + header_length) // 8) * 8
+
+def write_mass_table(path: str, registry: Registry, max_deletions: int = 4):
+    '''
+    Enumerates every multiset of up to max_deletions deletions of the residues of the registry and writes them, sorted
+    by mass, as a table that MassTable can map. Returns the number of rows.
+    '''
+    deletions = {}
+    for symbol, deltas in registry.residue_deltas.items():
+        for delta in deltas:
+            if delta.type == DeltaType.DELETION:
+                deletions[symbol] = delta.mass_units
+    alphabet = sorted(deletions, key=lambda x: -deletions[x])
+    if len(alphabet) >= EMPTY:
+        raise ValueError(f'A mass table can hold at most {EMPTY - 1} residues')
+
+    rows = []
+    for r in range(max_deletions + 1):
+        for composition in itertools.combinations_with_replacement(range(len(alphabet)), r):
+            rows.append((sum(deletions[alphabet[i]] for i in composition), composition))
+    rows.sort(key=lambda x: x[0])
+
+    header = json.dumps({'data_hash': registry.data_hash, 'alphabet': alphabet, 'max_deletions': max_deletions, 'rows': len(rows)}).encode()
+    # Written to a temporary file and renamed, so that a process mapping the old table never sees a partial one
+    temporary_path = f'{path}.{os.getpid()}.tmp'
+    with open(temporary_path, 'wb') as file:
+        file.write(MAGIC + struct.pack('<I', len(header)) + header)
+        file.write(b'\0' * (get_masses_start(len(header)) - file.tell()))
+        file.write(struct.pack(f'={len(rows)}q', *(mass for mass, _ in rows)))
+        file.write(bytes(i for _, composition in rows for i in composition + (EMPTY,) * (max_deletions - len(composition))))
+    os.replace(temporary_path, path)
+    return len(rows)
+
+@functools.cache
+def get_mass_table(path: str = MASS_TABLE_PATH):
+    '''
+    Maps the mass table once per process.
+    '''
+    return MassTable(path)
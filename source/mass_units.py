@@ -0,0 +1,16 @@
+# Masses are added up and compared as integers in micro-daltons, so sums of many deltas and the edges of tolerance windows
+# do not depend on accumulated floating point rounding. Every mass in the data has at most 4 decimals, so the conversion
+# is exact.
+MASS_UNITS_PER_DALTON = 1000000
+
+def to_units(mass: float):
+    '''
+    Converts a mass in daltons to the nearest integer number of mass units.
+    '''
+    return round(mass * MASS_UNITS_PER_DALTON)
+
+def from_units(mass_units: int):
+    '''
+    Converts an integer number of mass units to daltons.
+    '''
+    return mass_units / MASS_UNITS_PER_DALTON
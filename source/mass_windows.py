@@ -0,0 +1,36 @@
+from bisect import bisect_right
+
+class MassWindows:
+    def __init__(self, windows: list[tuple[float, float]]):
+        '''
+        A union of closed (min_mass, max_mass) windows, merged into sorted, disjoint windows.
+        '''
+        merged = []
+        for min_mass, max_mass in sorted(windows):
+            if min_mass > max_mass:
+                continue
+            if merged and min_mass <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], max_mass)
+            else:
+                merged.append([min_mass, max_mass])
+
+        self.min_masses = [window[0] for window in merged]
+        self.max_masses = [window[1] for window in merged]
+        self.min_mass = self.min_masses[0] if merged else float('inf')
+        self.max_mass = self.max_masses[-1] if merged else float('-inf')
+
+    def overlaps(self, min_mass: float, max_mass: float):
+        '''
+        Checks whether any window overlaps min_mass <= mass <= max_mass.
+        '''
+        i = bisect_right(self.min_masses, max_mass) - 1
+        return i >= 0 and self.max_masses[i] >= min_mass
+
+    def contains(self, mass: float):
+        return self.overlaps(mass, mass)
+
+    def __len__(self):
+        return len(self.min_masses)
+
+    def __repr__(self):
+        return f"MassWindows({list(zip(self.min_masses, self.max_masses))})"
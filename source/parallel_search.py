@@ -0,0 +1,123 @@
+import functools
+import heapq
+import math
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
+from source import delta_finder
+from source.delta import DeltaType
+from source.delta_space import DeltaSpace
+from source.peptide import Peptide
+from source.search_stats import SearchStats
+
+# Work is packed into this many chunks per process, so that a chunk that turns out larger than its estimate does not
+# leave the other processes idle for long
+CHUNKS_PER_PROCESS = 4
+
+@functools.lru_cache(maxsize=16)
+def get_cached_delta_space(sequence: str, n_terminus: str, c_terminus: str, max_deletions: int, delta_types: frozenset[DeltaType]):
+    '''
+    Builds the search space for a query once per worker process.
+    '''
+    return delta_finder.get_delta_space(Peptide(sequence, n_terminus, c_terminus), max_deletions, delta_types)
+
+def estimate_subtree_size(delta_space: DeltaSpace, node: tuple):
+    '''
+    Estimates the number of nodes under a node as the number of multisets of at most its remaining cap that can be
+    drawn from the kinds at or after its last kind in the first block. Pruning makes the real subtree smaller, but the
+    estimate keeps the relative sizes of subtrees.
+    '''
+    kinds = delta_space.first_block_end - node[0][-1]
+    remaining = node[4]
+    return math.comb(kinds + remaining, remaining)
+
+def search_subtrees(query: tuple, units: list[tuple[int, tuple]], windows: list):
+    '''
+    Searches the subtree of every (truncation index, node) unit of a chunk within the truncation's windows, and returns
+    the compositions found for each unit and the number of nodes expanded.
+    '''
+    delta_space = get_cached_delta_space(*query)
+    stats = SearchStats()
+    results = [list(delta_space.iter_compositions(windows[t], stats, node)) for t, node in units]
+    return results, stats.nodes_expanded
+
+def pack_chunks(units: list[tuple[int, tuple]], sizes: list[int], chunks: int):
+    '''
+    Packs the units into at most the given number of chunks with similar estimated sizes, largest units first, and
+    returns the indices of the units in each chunk.
+    '''
+    heap = [(0, i, []) for i in range(min(chunks, len(units)))]
+    for unit in sorted(range(len(units)), key=lambda unit: -sizes[unit]):
+        size, i, chunk = heapq.heappop(heap)
+        chunk.append(unit)
+        heapq.heappush(heap, (size + sizes[unit], i, chunk))
+    return sorted((chunk for _, _, chunk in heap), key=lambda chunk: -sum(sizes[unit] for unit in chunk))
+
+def get_parallel_solutions(peptide: Peptide, target_mass: float, confidence: float, max_deletions: int = 4, stats: SearchStats = None, delta_types: set[DeltaType] = None, processes: int = None, executor: Executor = None):
+    '''
+    Gets the same solutions as delta_finder.get_solutions, in the same order, with the search for one query split
+    across a pool of processes (or the given executor).
+
+    The work is split by truncation and by the first delta chosen in each truncation's search. Every unit is a subtree
+    of the serial depth-first search, so concatenating the results of the units in serial order reproduces the serial
+    result exactly. Units are balanced across chunks by their estimated subtree sizes. A node budget in stats is not
+    split across processes, so a query with one is searched serially.
+    '''
+    if stats is not None and stats.max_nodes is not None:
+        return delta_finder.get_solutions(peptide, target_mass, confidence, max_deletions, stats=stats, delta_types=delta_types)
+
+    delta_space = delta_finder.get_delta_space(peptide, max_deletions, delta_types)
+    truncations = delta_finder.get_truncations(peptide, target_mass, confidence, delta_space.min_units)
+    _, truncation_windows = delta_finder.get_truncation_windows(peptide, truncations, target_mass, confidence)
+
+    # The root of every reachable truncation is expanded here, and its children become the units of parallel work
+    nodes_expanded = 0
+    root_compositions = []
+    units = []
+    for t, windows in enumerate(truncation_windows):
+        if not delta_space.can_reach(windows):
+            root_compositions.append([])
+            continue
+        nodes_expanded += 1
+        root_compositions.append(delta_space.get_completions(DeltaSpace.ROOT, windows))
+        units.extend((t, child) for child in delta_space.get_children(DeltaSpace.ROOT, windows))
+
+    unit_compositions = [None] * len(units)
+    if units:
+        processes = processes or os.cpu_count()
+        sizes = [estimate_subtree_size(delta_space, node) for _, node in units]
+        query = (peptide.sequence, peptide.n_termini_species, peptide.c_termini_species, max_deletions, None if delta_types is None else frozenset(delta_types))
+        chunks = pack_chunks(units, sizes, processes * CHUNKS_PER_PROCESS)
+
+        owned_executor = executor is None
+        executor = executor or ProcessPoolExecutor(max_workers=processes)
+        try:
+            futures = [(chunk, executor.submit(search_subtrees, query, [units[unit] for unit in chunk], truncation_windows)) for chunk in chunks]
+            for chunk, future in futures:
+                results, chunk_nodes_expanded = future.result()
+                nodes_expanded += chunk_nodes_expanded
+                for unit, compositions in zip(chunk, results):
+                    unit_compositions[unit] = compositions
+        finally:
+            if owned_executor:
+                executor.shutdown()
+
+    # Reassemble the compositions in the order of the serial search: truncation by truncation, the root's own
+    # compositions first and then every child's subtree in index order
+    solutions = []
+    unit = 0
+    truncation_limits = delta_finder.get_truncation_limits(peptide, truncations, delta_types)
+    for t, truncation in enumerate(truncations):
+        compositions = list(root_compositions[t])
+        while unit < len(units) and units[unit][0] == t:
+            compositions.extend(unit_compositions[unit])
+            unit += 1
+        for composition, mass, likelihood in compositions:
+            delta_combination = delta_space.to_delta_set(composition, mass, likelihood)
+            if delta_finder.fits_truncation(truncation_limits[t], delta_combination):
+                solutions.append(delta_finder.add_truncation(peptide, truncation, delta_combination))
+
+    if stats is not None:
+        stats.nodes_expanded += nodes_expanded
+        stats.solutions += len(solutions)
+
+    return sorted(solutions, key=lambda x: x.likelihood)
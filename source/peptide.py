@@ -1,24 +1,24 @@
-import json
+from source.mass_units import from_units, to_units
+from source.registry import get_registry
 
 class Peptide:
-    termini_species_masses = json.loads(open('data/termini_species.json').read())
-    residues = json.loads(open('data/residues.json').read())
-
     def __init__(self, sequence, n_termini_species, c_termini_species, mass=None):
         self.sequence = sequence
         self.n_termini_species = n_termini_species
         self.c_termini_species = c_termini_species
-        self.mass = mass if mass else self.calculate_mass()
+        self.mass_units = to_units(mass) if mass else self.calculate_mass_units()
+        self.mass = from_units(self.mass_units)
 
-    def calculate_mass(self):
+    def calculate_mass_units(self):
             '''
-            calculates expected peptide mass from input sequence
+            calculates expected peptide mass (in integer mass units) from input sequence
             '''
+            registry = get_registry()
             total_mass = 0
             for aa in self.sequence:
-                total_mass += self.residues[aa]['mass']
+                total_mass += registry.residue_mass_units[aa]
             
-            total_mass += self.termini_species_masses[self.n_termini_species]
-            total_mass += self.termini_species_masses[self.c_termini_species]
+            total_mass += registry.termini_species_mass_units[self.n_termini_species]
+            total_mass += registry.termini_species_mass_units[self.c_termini_species]
 
             return total_mass
\ No newline at end of file
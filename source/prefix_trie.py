@@ -0,0 +1,27 @@
+from source.registry import get_registry
+
+class PrefixTrie:
+    def __init__(self):
+        '''
+        A trie of residue sequences where every node holds the mass of its prefix in mass units, so that sequences that
+        share a prefix (the variants of a library, or the truncations of a sequence) add up its mass once.
+        '''
+        # Every node is [mass units of the prefix, {residue: child node}]
+        self.root = [0, {}]
+        self.nodes = 1
+
+    def insert(self, sequence: str):
+        '''
+        Adds the sequence and gets the masses of its prefixes, where the i-th mass is that of the first i residues.
+        '''
+        residue_mass_units = get_registry().residue_mass_units
+        node = self.root
+        prefix_units = [0]
+        for residue in sequence:
+            child = node[1].get(residue)
+            if child is None:
+                child = node[1][residue] = [node[0] + residue_mass_units[residue], {}]
+                self.nodes += 1
+            node = child
+            prefix_units.append(node[0])
+        return prefix_units
@@ -0,0 +1,262 @@
+import asyncio
+import json
+import os
+import stat
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from source import batch, delta_finder, parallel_search
+from source.delta import DeltaType
+from source.mass_units import from_units, to_units
+from source.peptide import Peptide
+from source.search_stats import SearchStats
+
+# Searches expand about this many nodes in the 50 to 100 ms it takes to reach the budget, so a search that needs more is
+# moved to a process before it holds up the warm queries sharing the interpreter lock for long
+THREAD_NODES = 10000
+
+class QueryServer:
+    def __init__(self, max_peptides: int = 256, executor: Executor = None, delta_types: set[DeltaType] = None, max_nodes: int = None, process_executor: Executor = None, processes: int = None, thread_nodes: int = THREAD_NODES):
+        '''
+        Answers queries sent as JSON lines by a long-running process, so that callers do not pay for interpreter startup,
+        loading the tables and building the search space of a peptide on every query.
+
+        The search spaces of the max_peptides most recently queried peptides are kept warm. Searches run on the executor
+        (a pool of threads by default, which share the warm spaces) so that the event loop keeps accepting requests, and
+        identical queries that arrive while one is being searched wait for its result instead of searching again.
+        delta_types and max_nodes are the defaults of queries that do not give their own.
+
+        Threads only run one search at a time under the interpreter lock, so a search on a thread stops after
+        thread_nodes nodes, and a search that needs more is run again from the start on the process executor (by
+        default a pool of the given number of processes, started by the first heavy search), where it does not hold up
+        the warm, small queries. With a thread_nodes of None every search runs on the executor.
+        '''
+        self.max_peptides = max_peptides
+        self.executor = executor or ThreadPoolExecutor()
+        self.process_executor = process_executor
+        self.processes = processes
+        self.thread_nodes = thread_nodes
+        self.delta_types = delta_types
+        self.max_nodes = max_nodes
+        self.delta_spaces = OrderedDict()
+        self.in_flight = {}
+        self.started = time.monotonic()
+        self.counters = {'requests': 0, 'errors': 0, 'coalesced': 0, 'offloaded': 0, 'peptide_hits': 0, 'peptide_misses': 0}
+        self.total_seconds = self.max_seconds = 0
+
+    async def coalesce(self, key: tuple, function, *args):
+        '''
+        Awaits the function called with the arguments, unless a call with the same key is already running, in which case
+        its result is awaited instead.
+        '''
+        future = self.in_flight.get(key)
+        if future is not None:
+            self.counters['coalesced'] += 1
+            return await asyncio.shield(future)
+
+        future = asyncio.ensure_future(function(*args))
+        self.in_flight[key] = future
+        try:
+            return await asyncio.shield(future)
+        finally:
+            if self.in_flight.get(key) is future:
+                del self.in_flight[key]
+
+    def run_in_thread(self, function, *args):
+        return asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    def get_process_executor(self):
+        if self.process_executor is None:
+            self.process_executor = ProcessPoolExecutor(max_workers=self.processes)
+        return self.process_executor
+
+    async def search(self, peptide: Peptide, target_mass: float, confidence: float, max_deletions: int, top_k: int, delta_types: frozenset[DeltaType], max_nodes: int, delta_space, profile: bool):
+        '''
+        Searches on a thread with the warm search space, or on a process if the search needs more than thread_nodes
+        nodes.
+        '''
+        if self.thread_nodes is None or (max_nodes is not None and max_nodes <= self.thread_nodes):
+            return await self.run_in_thread(search, peptide, target_mass, confidence, max_deletions, top_k, delta_types, max_nodes, delta_space, profile)
+
+        solutions, stats = await self.run_in_thread(search, peptide, target_mass, confidence, max_deletions, top_k, delta_types, self.thread_nodes, delta_space, profile)
+        if not stats.partial:
+            stats.max_nodes = max_nodes
+            return solutions, stats
+
+        self.counters['offloaded'] += 1
+        future = self.get_process_executor().submit(search_in_process, peptide, target_mass, confidence, max_deletions, top_k, delta_types, max_nodes, profile)
+        return await asyncio.wrap_future(future)
+
+    async def get_delta_space(self, peptide: Peptide, max_deletions: int, delta_types: frozenset[DeltaType]):
+        '''
+        Gets the warm search space of the peptide, building it on the executor if it is not one of the most recently
+        used.
+        '''
+        key = (peptide.sequence, peptide.n_termini_species, peptide.c_termini_species, max_deletions, delta_types)
+        delta_space = self.delta_spaces.get(key)
+        if delta_space is not None:
+            self.counters['peptide_hits'] += 1
+            self.delta_spaces.move_to_end(key)
+            return delta_space
+
+        self.counters['peptide_misses'] += 1
+        delta_space = await self.coalesce(('delta_space',) + key, self.run_in_thread, build_delta_space, peptide, max_deletions, delta_types)
+        self.delta_spaces[key] = delta_space
+        while len(self.delta_spaces) > self.max_peptides:
+            self.delta_spaces.popitem(last=False)
+        return delta_space
+
+    async def solve(self, request: dict):
+        '''
+        Finds the solutions for a sample and returns the same record as batch.solve_sample. Besides the sample fields, a
+        request may give top_k, max_deletions, max_nodes, modifications (true to search every type of delta) and
+        profile (true to add the search's profile to the record).
+        '''
+        record = {field: request.get(field) for field in batch.SAMPLE_FIELDS}
+        try:
+            peptide = Peptide(str(request['sequence']).upper(), request['n_terminus'], request['c_terminus'])
+            target_mass = peptide.mass - batch.parse_finite(request['observed_mass'], 'observed_mass')
+            tolerance = batch.parse_tolerance(request['tolerance'])
+            top_k = None if request.get('top_k') is None else parse_count(request['top_k'], 'top_k')
+            max_deletions = parse_count(request.get('max_deletions', 4), 'max_deletions')
+            max_nodes = self.max_nodes if request.get('max_nodes') is None else parse_count(request['max_nodes'], 'max_nodes')
+            if 'modifications' in request:
+                delta_types = frozenset(DeltaType) - {DeltaType.TRUNCATION} if request['modifications'] else None
+            else:
+                delta_types = None if self.delta_types is None else frozenset(self.delta_types)
+            delta_space = await self.get_delta_space(peptide, max_deletions, delta_types)
+        except (KeyError, TypeError, ValueError) as e:
+            record['error'] = f'{type(e).__name__}: {e}'
+            return record
+
+        # Queries are keyed (and searched) in integer mass units, so queries that only differ by float noise share a search
+        target_units, tolerance_units = to_units(target_mass), to_units(tolerance)
+        profile = bool(request.get('profile'))
+        key = ('solve', peptide.sequence, peptide.n_termini_species, peptide.c_termini_species, target_units, tolerance_units, max_deletions, top_k, delta_types, max_nodes, profile)
+        solutions, stats = await self.coalesce(key, self.search, peptide, from_units(target_units), from_units(tolerance_units), max_deletions, top_k, delta_types, max_nodes, delta_space, profile)
+        return batch.add_solutions(record, peptide, target_mass, solutions, stats)
+
+    async def respond(self, request: dict):
+        '''
+        Gets the response to a request, echoing its id if it has one.
+        '''
+        start = time.perf_counter()
+        self.counters['requests'] += 1
+        op = request.get('op', 'solve')
+        try:
+            if op == 'solve':
+                response = await self.solve(request)
+            elif op == 'health':
+                response = {'status': 'ok', 'uptime_seconds': time.monotonic() - self.started}
+            elif op == 'metrics':
+                response = self.get_metrics()
+            else:
+                response = {'error': f"Unknown op '{op}'"}
+        except Exception as e:
+            # Every request gets a response, or its client would wait for one forever
+            response = {'error': f'{type(e).__name__}: {e}'}
+        if 'error' in response:
+            self.counters['errors'] += 1
+        if 'id' in request:
+            response['id'] = request['id']
+
+        seconds = time.perf_counter() - start
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        return response
+
+    def get_metrics(self):
+        return self.counters | {
+            'cached_peptides': len(self.delta_spaces),
+            'in_flight': len(self.in_flight),
+            'mean_ms': 1000 * self.total_seconds / self.counters['requests'] if self.counters['requests'] else 0,
+            'max_ms': 1000 * self.max_seconds,
+            'uptime_seconds': time.monotonic() - self.started
+        }
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        '''
+        Serves one connection. Every line is a JSON request and gets one JSON line in response. Requests on the same
+        connection are answered concurrently, so responses may come back out of order and should be matched by id.
+        '''
+        async def answer(line: bytes):
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError('A request must be a JSON object')
+            except ValueError as e:
+                self.counters['requests'] += 1
+                self.counters['errors'] += 1
+                response = {'error': f'{type(e).__name__}: {e}'}
+            else:
+                response = await self.respond(request)
+            writer.write(json.dumps(response).encode() + b'\n')
+            await writer.drain()
+
+        tasks = set()
+        try:
+            while line := await reader.readline():
+                if line.strip():
+                    task = asyncio.create_task(answer(line))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except ConnectionError:
+            pass # The client went away
+        finally:
+            writer.close()
+
+    async def start(self, address: str):
+        '''
+        Starts listening on a Unix socket at the path, or on TCP for a HOST:PORT address.
+        '''
+        host, _, port = address.rpartition(':')
+        if host and port.isdigit():
+            return await asyncio.start_server(self.handle, host, int(port))
+        # A socket left behind by a server that did not shut down cleanly would make binding fail
+        if os.path.exists(address) and stat.S_ISSOCK(os.stat(address).st_mode):
+            os.remove(address)
+        return await asyncio.start_unix_server(self.handle, address)
+
+def parse_count(value, name: str):
+    '''
+    Parses a count given by a request, which must be a non-negative integer.
+    '''
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise TypeError(f"'{name}' must be an integer, not {value!r}")
+    count = int(value)
+    if count < 0:
+        raise ValueError(f"'{name}' must not be negative, not {value}")
+    return count
+
+def build_delta_space(peptide: Peptide, max_deletions: int, delta_types: frozenset[DeltaType]):
+    '''
+    Builds the search space of a peptide together with its bitset of reachable masses, which would otherwise be built
+    by the first query.
+    '''
+    delta_space = delta_finder.get_delta_space(peptide, max_deletions, delta_types)
+    delta_space.get_reachable()
+    return delta_space
+
+def search(peptide: Peptide, target_mass: float, confidence: float, max_deletions: int, top_k: int, delta_types: frozenset[DeltaType], max_nodes: int, delta_space, profile: bool = False):
+    stats = SearchStats(max_nodes, profile)
+    solutions = delta_finder.get_solutions(peptide, target_mass, confidence, max_deletions, top_k=top_k, stats=stats, delta_types=delta_types, delta_space=delta_space)
+    return solutions, stats
+
+def search_in_process(peptide: Peptide, target_mass: float, confidence: float, max_deletions: int, top_k: int, delta_types: frozenset[DeltaType], max_nodes: int, profile: bool = False):
+    '''
+    Searches in a worker process, which keeps its own warm search spaces.
+    '''
+    delta_space = parallel_search.get_cached_delta_space(peptide.sequence, peptide.n_termini_species, peptide.c_termini_species, max_deletions, delta_types)
+    return search(peptide, target_mass, confidence, max_deletions, top_k, delta_types, max_nodes, delta_space, profile)
+
+async def serve(address: str, **kwargs):
+    '''
+    Runs a QueryServer on the address until the process is stopped.
+    '''
+    server = await QueryServer(**kwargs).start(address)
+    print(f'Listening on {address}', file=sys.stderr)
+    async with server:
+        await server.serve_forever()
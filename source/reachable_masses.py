@@ -0,0 +1,55 @@
+from source.mass_units import MASS_UNITS_PER_DALTON
+from source.mass_windows import MassWindows
+
+class ReachableMasses:
+    def __init__(self, blocks: list[tuple[int, list[tuple[int, int]]]], bin_units: int = MASS_UNITS_PER_DALTON // 100):
+        '''
+        A bitset of every mass (in bins of bin_units mass units, 10 milli-daltons by default) that some combination of
+        deltas can add up to. blocks is a list of (cap, [(mass units, count), ...]), where at most cap deltas can be taken
+        from each block and at most count of each kind.
+
+        The bitset is a Python int built by shifted-OR dynamic programming: taking a delta of mass m shifts every
+        reachable mass by m bins. Each block keeps one bitset per number of deltas taken from it, so that its cap is
+        respected exactly. Bit i stands for the mass (i - offset) bins.
+        '''
+        self.bin_units = bin_units
+
+        # Rounding every delta to a bin can move a sum by up to half a bin per delta, so queries are widened by that much
+        bin_blocks = [(cap, [(round(units / bin_units), count) for units, count in kinds]) for cap, kinds in blocks]
+        self.slack = sum(cap for cap, _ in bin_blocks) // 2 + 1
+
+        self.offset = 0
+        for cap, kinds in bin_blocks:
+            negatives = sorted(mass for mass, count in kinds for _ in range(min(count, cap)) if mass < 0)
+            self.offset -= sum(negatives[:cap])
+
+        bits = 1 << self.offset
+        for cap, kinds in bin_blocks:
+            # taken[r] is every mass reachable with exactly r deltas from this block (and any from earlier blocks)
+            taken = [bits] + [0] * cap
+            for mass, count in kinds:
+                # Downwards so that taken[r - j] still excludes this kind when it is combined into taken[r]
+                for r in reversed(range(1, cap + 1)):
+                    for j in range(1, min(count, r) + 1):
+                        shift = j * mass
+                        taken[r] |= taken[r - j] << shift if shift >= 0 else taken[r - j] >> -shift
+            for block_bits in taken[1:]:
+                bits |= block_bits
+        self.bits = bits
+
+    def overlaps(self, min_units: int, max_units: int):
+        '''
+        Checks whether any reachable mass could be within min_units <= mass <= max_units. Never misses a reachable mass,
+        but may report one that is only within the slack of the window.
+        '''
+        start = max(min_units // self.bin_units - self.slack + self.offset, 0)
+        end = -(-max_units // self.bin_units) + self.slack + self.offset
+        if end < start:
+            return False
+        return (self.bits >> start) & ((1 << (end - start + 1)) - 1) != 0
+
+    def reaches(self, windows: MassWindows):
+        '''
+        Checks whether any reachable mass could be within any of the windows, given in mass units.
+        '''
+        return any(self.overlaps(min_units, max_units) for min_units, max_units in zip(windows.min_masses, windows.max_masses))
@@ -0,0 +1,170 @@
+import functools
+import hashlib
+import json
+import math
+import os
+import pickle
+from types import MappingProxyType
+from source.delta import Delta, DeltaType
+from source.mass_units import to_units
+
+DATA_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+CACHE_PATH = os.path.join(DATA_DIRECTORY, '.registry-cache.pickle')
+# The tables the registry is compiled from, in the order of the arguments of Registry
+DATA_FILES = ['residues.json', 'termini_species.json', 'delta_classes.json', 'charge_carriers.json']
+# Bumped whenever the compiled registry gains or changes attributes, so that caches pickled by older code are rebuilt
+CACHE_VERSION = 4
+
+POSITIONS = ['residue', 'n_terminal_residue', 'c_terminal_residue', 'peptide']
+
+class Registry:
+    def __init__(self, residues: dict, termini_species_masses: dict, delta_classes: dict = None, charge_carrier_masses: dict = None, data_hash: str = None):
+        '''
+        Validates the residue, termini species, delta class and charge carrier tables and compiles them into read-only
+        lookups.
+        '''
+        delta_classes = delta_classes or {}
+        charge_carrier_masses = charge_carrier_masses or {}
+        validate_delta_classes(delta_classes)
+        validate_residues(residues, delta_classes)
+        validate_termini_species(termini_species_masses)
+        validate_charge_carriers(charge_carrier_masses)
+
+        self.data_hash = data_hash
+        self.residues = freeze({symbol: {key: value for key, value in residue.items() if key != 'deltas'} for symbol, residue in residues.items()})
+        self.termini_species_masses = freeze(termini_species_masses)
+        # Mass of each ion that can carry a charge, e.g. a proton for [M+zH]z+
+        self.charge_carrier_masses = freeze(charge_carrier_masses)
+        self.residue_masses = freeze({symbol: residue['mass'] for symbol, residue in residues.items()})
+        self.residue_mass_units = freeze({symbol: to_units(mass) for symbol, mass in self.residue_masses.items()})
+        self.termini_species_mass_units = freeze({species: to_units(mass) for species, mass in termini_species_masses.items()})
+        self.residue_deltas = freeze({symbol: tuple(Delta(delta['mass'], DeltaType(delta['type']), delta['likelihood'], delta['description']) for delta in residue['deltas']) for symbol, residue in residues.items()})
+        self.non_canonicals = tuple(symbol for symbol, residue in residues.items() if residue['non_canonical'])
+
+        # Every class of delta other than deletions, with its cap, positional rules and (for deltas of the whole peptide)
+        # its deltas
+        self.delta_classes = freeze({DeltaType(delta_type): {
+            'max_occurrences': delta_class['max_occurrences'],
+            'position': delta_class['position'],
+            'n_termini': tuple(delta_class['n_termini']) if 'n_termini' in delta_class else None,
+            'deltas': tuple(Delta(delta['mass'], DeltaType(delta_type), delta['likelihood'], delta['description']) for delta in delta_class.get('deltas', []))
+        } for delta_type, delta_class in delta_classes.items()})
+        self.delta_caps = freeze({delta_type: delta_class['max_occurrences'] for delta_type, delta_class in self.delta_classes.items()})
+
+        # Residue mass by the ascii code of its symbol (nan for codes that are not residues)
+        mass_table = [math.nan] * 256
+        for symbol, residue in residues.items():
+            mass_table[ord(symbol)] = residue['mass']
+        self.mass_table = tuple(mass_table)
+
+    @classmethod
+    def load(cls, data_directory: str = DATA_DIRECTORY, cache_path: str = None):
+        '''
+        Loads the registry from the DATA_FILES. If a cache path is given, the compiled registry is read from it when the
+        hash of the JSON files matches, and rewritten otherwise.
+        '''
+        data_json = []
+        for data_file in DATA_FILES:
+            with open(os.path.join(data_directory, data_file), 'rb') as file:
+                data_json.append(file.read())
+        data_hash = hashlib.sha256(b'\0'.join(data_json)).hexdigest()
+
+        if cache_path:
+            try:
+                with open(cache_path, 'rb') as file:
+                    version, registry = pickle.load(file)
+                if version == CACHE_VERSION and isinstance(registry, cls) and registry.data_hash == data_hash:
+                    return registry
+            except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError, TypeError, ValueError):
+                # A missing or corrupt cache, or one written by another version of the code, is rebuilt
+                pass
+
+        registry = cls(*[json.loads(data) for data in data_json], data_hash=data_hash)
+
+        if cache_path:
+            # Written to a temporary file and renamed, so that other processes loading the registry never read a partial one
+            temporary_path = f'{cache_path}.{os.getpid()}.tmp'
+            try:
+                with open(temporary_path, 'wb') as file:
+                    pickle.dump((CACHE_VERSION, registry), file)
+                os.replace(temporary_path, cache_path)
+            except OSError:
+                # The cache is optional, e.g. when the data directory is read-only
+                try:
+                    os.remove(temporary_path)
+                except OSError:
+                    pass
+
+        return registry
+
+    def __getstate__(self):
+        # Read-only mappings cannot be pickled, so they are stored as plain dicts
+        return thaw(self.__dict__)
+
+    def __setstate__(self, state):
+        self.__dict__.update({key: freeze(value) for key, value in state.items()})
+
+def freeze(value):
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    return value
+
+def thaw(value):
+    if isinstance(value, (dict, MappingProxyType)):
+        return {key: thaw(item) for key, item in value.items()}
+    return value
+
+def validate_residues(residues: dict, delta_classes: dict):
+    for symbol, residue in residues.items():
+        if len(symbol) != 1 or not symbol.isascii():
+            raise ValueError(f"Residue symbol '{symbol}' must be a single ascii character")
+        for key, key_type in [('name', str), ('mass', (int, float)), ('non_canonical', bool), ('deltas', list)]:
+            if not isinstance(residue.get(key), key_type):
+                raise ValueError(f"Residue '{symbol}' is missing a valid '{key}'")
+        if residue['mass'] <= 0:
+            raise ValueError(f"Residue '{symbol}' must have a positive mass")
+        for delta in residue['deltas']:
+            if delta.get('type') != DeltaType.DELETION.value and delta.get('type') not in delta_classes:
+                raise ValueError(f"Delta '{delta.get('description')}' of residue '{symbol}' has an unknown type")
+            if delta['type'] in delta_classes and delta_classes[delta['type']]['position'] == 'peptide':
+                raise ValueError(f"Delta '{delta.get('description')}' of residue '{symbol}' belongs to a class of deltas of the whole peptide")
+            validate_delta(delta, f"Delta '{delta.get('description')}' of residue '{symbol}'")
+
+def validate_delta_classes(delta_classes: dict):
+    for delta_type, delta_class in delta_classes.items():
+        if delta_type not in DeltaType._value2member_map_ or delta_type in [DeltaType.DELETION.value, DeltaType.TRUNCATION.value]:
+            raise ValueError(f"Delta class '{delta_type}' must be a type of delta other than deletions and truncations")
+        if not isinstance(delta_class.get('max_occurrences'), int) or delta_class['max_occurrences'] < 0:
+            raise ValueError(f"Delta class '{delta_type}' must have a non-negative 'max_occurrences'")
+        if delta_class.get('position') not in POSITIONS:
+            raise ValueError(f"Delta class '{delta_type}' must have a position in {POSITIONS}")
+        if not isinstance(delta_class.get('n_termini', []), list):
+            raise ValueError(f"Delta class '{delta_type}' must list its 'n_termini'")
+        if (delta_class['position'] == 'peptide') != ('deltas' in delta_class):
+            raise ValueError(f"Delta class '{delta_type}' must list its 'deltas' if and only if it applies to the whole peptide")
+        for delta in delta_class.get('deltas', []):
+            validate_delta(delta, f"Delta '{delta.get('description')}' of class '{delta_type}'")
+
+def validate_delta(delta: dict, name: str):
+    for key, key_type in [('mass', (int, float)), ('likelihood', int), ('description', str)]:
+        if not isinstance(delta.get(key), key_type):
+            raise ValueError(f"{name} is missing a valid '{key}'")
+    if delta['likelihood'] < 0:
+        raise ValueError(f"{name} must have a non-negative likelihood")
+
+def validate_termini_species(termini_species_masses: dict):
+    for species, mass in termini_species_masses.items():
+        if not isinstance(mass, (int, float)):
+            raise ValueError(f"Termini species '{species}' must have a numeric mass")
+
+def validate_charge_carriers(charge_carrier_masses: dict):
+    for carrier, mass in charge_carrier_masses.items():
+        if not isinstance(mass, (int, float)) or mass <= 0:
+            raise ValueError(f"Charge carrier '{carrier}' must have a positive mass")
+
+@functools.cache
+def get_registry():
+    '''
+    Gets the registry for the package's data directory, loading it once per process.
+    '''
+    return Registry.load(DATA_DIRECTORY, CACHE_PATH)
@@ -0,0 +1,102 @@
+import contextlib
+import hashlib
+import json
+import sqlite3
+import time
+from source import delta_finder
+from source.delta import DeltaType
+from source.delta_set import DeltaSet
+from source.peptide import Peptide
+from source.registry import get_registry
+from source.search_stats import SearchStats
+
+class ResultCache:
+    def __init__(self, path: str, max_bytes: int = 256 * 1024 * 1024, mass_quantum: float = .001, tolerance_quantum: float = .001, data_hash: str = None):
+        '''
+        A SQLite-backed cache of get_solutions results. Entries are keyed by the canonical query and the hash of the residue
+        and termini species tables, so editing the tables invalidates them. Delta masses and tolerances are rounded to
+        their quantum before searching, so near-identical queries share an entry. When the cached solutions exceed
+        max_bytes, the least recently used entries are evicted.
+
+        Every process should open its own ResultCache; SQLite's locking makes concurrent workers safe.
+        '''
+        self.path = path
+        self.max_bytes = max_bytes
+        self.mass_quantum = mass_quantum
+        self.tolerance_quantum = tolerance_quantum
+        self.data_hash = data_hash or get_registry().data_hash
+
+        self.connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, solutions TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)')
+
+    def quantize(self, value: float, quantum: float):
+        return round(value / quantum)
+
+    def get_key(self, peptide: Peptide, target_mass: float, confidence: float, max_deletions: int, top_k: int, delta_types: set[DeltaType] = None):
+        delta_types = None if delta_types is None else sorted(delta_type.value for delta_type in delta_types)
+        query = [peptide.sequence, peptide.n_termini_species, peptide.c_termini_species, self.quantize(target_mass, self.mass_quantum), self.quantize(confidence, self.tolerance_quantum), max_deletions, top_k, delta_types, self.data_hash]
+        return hashlib.sha256(json.dumps(query).encode()).hexdigest()
+
+    def get_solutions(self, peptide: Peptide, target_mass: float, confidence: float, max_deletions: int = 4, top_k: int = None, delta_types: set[DeltaType] = None, stats: SearchStats = None):
+        '''
+        Gets the solutions from the cache, or from delta_finder.get_solutions with the quantized target mass and
+        confidence, storing them for the next query. Partial solutions from a search that ran out of its node budget are
+        not stored.
+        '''
+        key = self.get_key(peptide, target_mass, confidence, max_deletions, top_k, delta_types)
+
+        cached_solutions = self.get(key)
+        if cached_solutions is not None:
+            return [DeltaSet.from_dict(solution) for solution in json.loads(cached_solutions)]
+
+        quantized_target_mass = self.quantize(target_mass, self.mass_quantum) * self.mass_quantum
+        quantized_confidence = self.quantize(confidence, self.tolerance_quantum) * self.tolerance_quantum
+        solutions = delta_finder.get_solutions(peptide, quantized_target_mass, quantized_confidence, max_deletions, top_k, stats, delta_types)
+        if stats is None or not stats.partial:
+            self.put(key, json.dumps([solution.to_dict() for solution in solutions]))
+        return solutions
+
+    def get(self, key: str):
+        row = self.connection.execute('SELECT solutions FROM results WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        self.connection.execute('UPDATE results SET last_used = ? WHERE key = ?', (time.time(), key))
+        return row[0]
+
+    def put(self, key: str, solutions: str):
+        with self.transaction():
+            self.connection.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)', (key, solutions, len(solutions), time.time()))
+            self.evict(keep=key)
+
+    def evict(self, keep: str = None):
+        '''
+        Deletes the least recently used entries, other than keep, until the cache fits in max_bytes.
+        '''
+        total_bytes = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+        if total_bytes <= self.max_bytes:
+            return
+        for key, size in self.connection.execute('SELECT key, size FROM results WHERE key != ? ORDER BY last_used', (keep,)).fetchall():
+            self.connection.execute('DELETE FROM results WHERE key = ?', (key,))
+            total_bytes -= size
+            if total_bytes <= self.max_bytes:
+                break
+
+    @contextlib.contextmanager
+    def transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so concurrent writers wait on the busy timeout instead of
+        # failing to upgrade a read lock
+        self.connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            self.connection.execute('ROLLBACK')
+            raise
+        self.connection.execute('COMMIT')
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,101 @@
+import contextlib
+import threading
+import time
+import tracemalloc
+try:
+    import resource
+except ImportError:
+    resource = None # Not available on Windows, where the resident set size is not reported
+
+# tracemalloc is global to the process, so only one memory pass traces at a time
+MEMORY_LOCK = threading.Lock()
+
+class SearchStats:
+    def __init__(self, max_nodes: int = None, profile: bool = False):
+        '''
+        Counters filled in by a search when a SearchStats instance is passed to it. If max_nodes is given, the search
+        stops once that many nodes have been expanded in total and sets partial, so the solutions found so far are
+        returned instead of exhausting the search.
+
+        With profile, the search also records the time of each stage, the deepest stack of nodes, the branches pruned,
+        the time, nodes and solutions of each truncation and the peak resident set size of the process. None of it is
+        collected otherwise, and a search without a SearchStats collects nothing at all.
+
+        Tracing allocations slows a search down several times over, so the peak memory allocated by a query
+        (peak_bytes) is only measured by a separate pass with measure_peak_memory, and never skews the timings.
+        '''
+        self.nodes_expanded = 0
+        self.solutions = 0
+        self.max_nodes = max_nodes
+        self.partial = False
+
+        self.profile = profile
+        self.timings = {}
+        self.max_stack = 0
+        self.branches_pruned = 0
+        self.truncations = []
+        self.max_rss_bytes = None
+        self.peak_bytes = None
+
+    def get_remaining_nodes(self):
+        '''
+        Gets the number of nodes left in the budget, or None if there is no budget.
+        '''
+        return None if self.max_nodes is None else max(self.max_nodes - self.nodes_expanded, 0)
+
+    def add_truncation(self, truncated: int, seconds: float, nodes_expanded: int, solutions: int):
+        self.truncations.append({'truncated': truncated, 'seconds': seconds, 'nodes_expanded': nodes_expanded, 'solutions': solutions})
+
+    def to_dict(self):
+        stats = {'nodes_expanded': self.nodes_expanded, 'solutions': self.solutions, 'partial': self.partial}
+        if self.profile:
+            stats |= {'timings': self.timings, 'max_stack': self.max_stack, 'branches_pruned': self.branches_pruned, 'truncations': self.truncations, 'max_rss_bytes': self.max_rss_bytes, 'peak_bytes': self.peak_bytes}
+        return stats
+
+    def __repr__(self):
+        return f"SearchStats(nodes_expanded={self.nodes_expanded}, solutions={self.solutions}, partial={self.partial})"
+
+def is_profiling(stats: SearchStats):
+    return stats is not None and stats.profile
+
+@contextlib.contextmanager
+def time_stage(stats: SearchStats, stage: str):
+    '''
+    Adds the time spent in the block to the stage's timing when stats is profiling.
+    '''
+    if not is_profiling(stats):
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.timings[stage] = stats.timings.get(stage, 0) + time.perf_counter() - start
+
+@contextlib.contextmanager
+def track_rss(stats: SearchStats):
+    '''
+    Records the peak resident set size of the process at the end of the block when stats is profiling. Reading it costs
+    a system call and does not slow the search down, but it is the high-water mark of the whole process.
+    '''
+    try:
+        yield
+    finally:
+        if is_profiling(stats) and resource is not None:
+            # ru_maxrss is in kilobytes on Linux
+            stats.max_rss_bytes = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def measure_peak_memory(function):
+    '''
+    Calls the function with allocation tracing on and gets the peak memory it allocated, in bytes. Passes are
+    serialized, but allocations made meanwhile by other threads are counted too.
+    '''
+    with MEMORY_LOCK:
+        if tracemalloc.is_tracing():
+            raise RuntimeError('Memory is already being traced')
+        tracemalloc.start()
+        try:
+            function()
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
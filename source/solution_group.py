@@ -0,0 +1,58 @@
+import itertools
+import math
+from source.delta import Delta
+from source.delta_set import DeltaSet
+
+class SolutionGroup:
+    def __init__(self, delta_set: DeltaSet, positions: dict[Delta, tuple[int, ...]], truncated: int = 0):
+        '''
+        A solution whose deltas of residues are not tied to positions in the sequence. positions maps each kind of delta
+        of a residue to every position it could be at; deltas of the whole peptide and truncations have no positions.
+        truncated is the number of residues missing from the N-terminus.
+
+        The concrete placements are only expanded when they are asked for, so a deletion of one of twenty glycines is one
+        group rather than twenty solutions.
+        '''
+        self.delta_set = delta_set
+        self.positions = positions
+        self.truncated = truncated
+        self.counts = {}
+        for delta in delta_set.deltas:
+            if delta in positions:
+                self.counts[delta] = self.counts.get(delta, 0) + 1
+
+    def count_placements(self):
+        '''
+        Counts the ways the deltas of residues can be placed on distinct positions.
+        '''
+        positions = [set(self.positions[delta]) for delta in self.counts]
+        if any(a & b for a, b in itertools.combinations(positions, 2)):
+            # Kinds that compete for the same residues (e.g. deleting or oxidizing a Met) have to be counted one by one
+            return sum(1 for _ in self.iter_placements())
+        return math.prod(math.comb(len(self.positions[delta]), count) for delta, count in self.counts.items())
+
+    def iter_placements(self):
+        '''
+        Generates every placement of the deltas of residues on distinct positions, as a tuple of (position, delta) pairs
+        sorted by position.
+        '''
+        kinds = list(self.counts.items())
+
+        def place(k: int, used: frozenset):
+            if k == len(kinds):
+                yield ()
+                return
+            delta, count = kinds[k]
+            available = [position for position in self.positions[delta] if position not in used]
+            for chosen in itertools.combinations(available, count):
+                for rest in place(k + 1, used | frozenset(chosen)):
+                    yield tuple((position, delta) for position in chosen) + rest
+
+        for placement in place(0, frozenset()):
+            yield tuple(sorted(placement, key=lambda x: x[0]))
+
+    def to_dict(self):
+        return self.delta_set.to_dict() | {'positions': [{'description': delta.description, 'positions': list(self.positions[delta])} for delta in self.counts], 'placements': self.count_placements()}
+
+    def __repr__(self):
+        return f"SolutionGroup(mass={self.delta_set.mass}, deltas='{self.delta_set.deltas}', placements={self.count_placements()})"
@@ -0,0 +1,70 @@
+import bisect
+from source import delta_finder
+from source.delta import DeltaType
+from source.mass_units import to_units
+from source.mass_windows import MassWindows
+from source.peptide import Peptide
+from source.search_stats import SearchStats
+
+class ToleranceSweep:
+    def __init__(self, peptide: Peptide, target_mass: float, max_deletions: int = 4, delta_types: set[DeltaType] = None, stats: SearchStats = None):
+        '''
+        The solutions of one peptide and target mass at any confidence, for exploring the confidence interactively. The
+        solutions found so far are kept sorted by their absolute mass error, so a confidence up to the widest one
+        searched is a slice, and a wider one only searches the band of masses that it newly admits. stats counts the
+        nodes and solutions of every search.
+        '''
+        self.peptide = peptide
+        self.target_mass = target_mass
+        self.max_deletions = max_deletions
+        self.delta_types = delta_types
+        self.stats = stats
+        self.delta_space = delta_finder.get_delta_space(peptide, max_deletions, delta_types)
+
+        # The widest confidence searched so far in mass units (None before the first search), the number of truncations
+        # searched at it and the solutions found, sorted by (absolute mass error, likelihood) with errors in mass units
+        self.confidence_units = None
+        self.searched_truncations = 0
+        self.errors = []
+        self.solutions = []
+
+    def get_solutions(self, confidence: float):
+        '''
+        Gets every solution within the confidence, sorted by absolute mass error and then by likelihood. The solutions
+        are the same as delta_finder.get_solutions finds for the confidence.
+        '''
+        confidence_units = to_units(confidence)
+        if self.confidence_units is None or confidence_units > self.confidence_units:
+            self.widen(confidence)
+        return self.solutions[:bisect.bisect_right(self.errors, confidence_units)]
+
+    def widen(self, confidence: float):
+        '''
+        Searches the masses that are within the confidence but not within the widest confidence searched so far.
+        Truncations that were already searched only search the two bands on either side of their old window, and
+        truncations that the wider confidence newly allows search their whole window.
+        '''
+        confidence_units = to_units(confidence)
+        truncations = delta_finder.get_truncations(self.peptide, self.target_mass, confidence, self.delta_space.min_units)
+        truncation_target_units, truncation_windows = delta_finder.get_truncation_windows(self.peptide, truncations, self.target_mass, confidence)
+        truncation_limits = delta_finder.get_truncation_limits(self.peptide, truncations, self.delta_types)
+
+        found = []
+        for t, truncation in enumerate(truncations):
+            target_units, windows = truncation_target_units[t], truncation_windows[t]
+            if t < self.searched_truncations:
+                old_units = self.confidence_units
+                windows = MassWindows([(target_units - confidence_units, target_units - old_units - 1), (target_units + old_units + 1, target_units + confidence_units)])
+            for composition, mass, likelihood in self.delta_space.iter_compositions(windows, self.stats):
+                delta_combination = self.delta_space.to_delta_set(composition, mass, likelihood)
+                if delta_finder.fits_truncation(truncation_limits[t], delta_combination):
+                    found.append((abs(mass - target_units), delta_finder.add_truncation(self.peptide, truncation, delta_combination)))
+        if self.stats is not None:
+            self.stats.solutions += len(found)
+
+        entries = list(zip(self.errors, self.solutions)) + found
+        entries.sort(key=lambda x: (x[0], x[1].likelihood))
+        self.errors = [error for error, _ in entries]
+        self.solutions = [solution for _, solution in entries]
+        self.confidence_units = confidence_units
+        self.searched_truncations = len(truncations)
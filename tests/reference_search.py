@@ -0,0 +1,22 @@
+from source.delta import Delta, DeltaType
+from source.delta_finder import generate_delta_sets, get_deltas, get_truncations
+from source.delta_set import DeltaSet
+from source.mass_units import from_units
+from source.peptide import Peptide
+
+def get_solutions_per_truncation(peptide: Peptide, target_mass: float, confidence: float):
+    '''
+    Reference implementation that searches the delta combinations separately for every truncation, shared by the tests
+    and scripts/benchmark_truncations.py.
+    '''
+    solutions = []
+    for truncation in get_truncations(peptide, target_mass, confidence):
+        truncated_mass = from_units(peptide.mass_units - truncation.mass_units)
+        # Only the residues left by the truncation can be deleted
+        deltas = get_deltas(peptide, start=len(peptide.sequence) - len(truncation.sequence))
+        for delta_combination in generate_delta_sets(deltas, target_mass - truncated_mass, confidence):
+            if truncation.mass < (peptide.mass - .01):
+                solutions.append(DeltaSet(delta_combination.deltas + (Delta(truncated_mass, DeltaType.TRUNCATION, 1, f"truncation of \'{peptide.sequence[:len(peptide.sequence) - len(truncation.sequence)]}\'"),)))
+            else:
+                solutions.append(DeltaSet(delta_combination.deltas))
+    return sorted(solutions, key=lambda x: x.likelihood)
@@ -0,0 +1,81 @@
+import io
+from source.batch import read_samples, run_batch, solve_fragments, solve_library, solve_peaks, solve_sample
+from source.peptide import Peptide
+
+def test_read_samples():
+    csv_file = io.StringIO('sequence,n_terminus,c_terminus,observed_mass,tolerance\nKAY,H,OH,310,1\n')
+    jsonl_file = io.StringIO('{"sequence": "KAY", "n_terminus": "H", "c_terminus": "OH", "observed_mass": 310, "tolerance": 1}\n\n')
+
+    assert list(read_samples(csv_file, 'csv')) == [{'sequence': 'KAY', 'n_terminus': 'H', 'c_terminus': 'OH', 'observed_mass': '310', 'tolerance': '1'}]
+    assert list(read_samples(jsonl_file, 'jsonl')) == [{'sequence': 'KAY', 'n_terminus': 'H', 'c_terminus': 'OH', 'observed_mass': 310, 'tolerance': 1}]
+
+def test_malformed_samples_get_error_records():
+    sample = '{"sequence": "KAY", "n_terminus": "H", "c_terminus": "OH", "observed_mass": 310, "tolerance": 1}'
+    lines = [sample, '[1, 2]', '3', '{"sequence": ', sample.replace('"tolerance": 1', '"tolerance": -1'), sample]
+
+    for records in [list(run_batch(read_samples(io.StringIO('\n'.join(lines)), 'jsonl'), processes=1)), solve_library(read_samples(io.StringIO('\n'.join(lines)), 'jsonl'))]:
+        assert ['error' in record for record in records] == [False, True, True, True, True, False]
+        assert records[1]['error'].startswith('TypeError') and records[3]['error'].startswith('JSONDecodeError')
+        assert records[0]['solutions'] == records[-1]['solutions']
+
+def test_solve_sample():
+    observed_mass = Peptide('ACDEFGHIKLNPQRSTVWY', 'H', 'OH').mass # Missing Met
+    record = solve_sample({'sequence': 'ACDEFGHIKLMNPQRSTVWY', 'n_terminus': 'H', 'c_terminus': 'OH', 'observed_mass': observed_mass, 'tolerance': 1})
+
+    assert len(record['solutions']) == 1
+    assert [delta['description'] for delta in record['solutions'][0]['deltas']] == ['M']
+
+    record = solve_sample({'sequence': 'KAJ', 'n_terminus': 'H', 'c_terminus': 'OH', 'observed_mass': 300, 'tolerance': 1})
+    assert 'error' in record
+
+    for observed_mass, tolerance in [('inf', '1'), ('300', 'inf'), ('nan', '1')]:
+        assert 'error' in solve_sample({'sequence': 'KAY', 'n_terminus': 'H', 'c_terminus': 'OH', 'observed_mass': observed_mass, 'tolerance': tolerance})
+
+def test_solve_sample_missing_mass_table(tmp_path):
+    sample = {'sequence': 'KAY', 'n_terminus': 'H', 'c_terminus': 'OH', 'observed_mass': 300, 'tolerance': 1}
+
+    records = list(run_batch(iter([sample, sample]), processes=1, mass_table_path=str(tmp_path / 'missing.bin')))
+
+    assert len(records) == 2 and all(record['error'].startswith('FileNotFoundError') for record in records)
+
+def test_solve_sample_profile():
+    sample = {'sequence': 'ACDEFGHIKLMNPQRSTVWY', 'n_terminus': 'H', 'c_terminus': 'OH', 'observed_mass': 2000, 'tolerance': 1}
+
+    assert solve_sample(sample, profile=True)['profile']['peak_bytes'] is None
+    record = solve_sample(sample, profile_memory=True)
+    assert record['profile']['peak_bytes'] > 0 and record['solutions'] == solve_sample(sample)['solutions']
+
+def test_run_batch_keeps_input_order():
+    samples = [{'sequence': 'KAY' * (i % 5 + 1), 'n_terminus': 'H', 'c_terminus': 'OH', 'observed_mass': 300 + i, 'tolerance': 1} for i in range(20)]
+
+    records = list(run_batch(iter(samples), processes=2, max_pending=3))
+
+    assert [record['observed_mass'] for record in records] == [sample['observed_mass'] for sample in samples]
+    assert records == [solve_sample(sample) for sample in samples]
+
+def test_solve_peaks():
+    peaks = [(Peptide('ACDEFGHIKLNPQRSTVWY', 'H', 'OH').mass, 1), (Peptide('ACDEFGHIKLMNPQRSTVWY', 'H', 'OH').mass + 500, 1)]
+
+    records = solve_peaks('ACDEFGHIKLMNPQRSTVWY', 'H', 'OH', peaks)
+
+    assert [record['observed_mass'] for record in records] == [peak[0] for peak in peaks]
+    assert [[delta['description'] for delta in solution['deltas']] for solution in records[0]['solutions']] == [['M']]
+    assert records[1]['solutions'] == []
+
+def test_solve_fragments():
+    peaks = [(Peptide('DEFGHIK', 'H', 'OH').mass, .01), (Peptide('ACDEF', 'H', 'OH').mass, .01), (Peptide('DEFGH', 'H', 'OH').mass, .01)]
+
+    records = solve_fragments('ACDEFGHIK', 'H', 'OH', peaks)
+
+    assert [record['fragments'] for record in records] == [
+        [{'start': 2, 'end': 9, 'kind': 'n_terminal_truncation', 'sequence': 'DEFGHIK'}],
+        [{'start': 0, 'end': 5, 'kind': 'c_terminal_truncation', 'sequence': 'ACDEF'}],
+        [{'start': 2, 'end': 7, 'kind': 'internal', 'sequence': 'DEFGH'}]
+    ]
+
+def test_solve_sample_node_budget():
+    sample = {'sequence': 'ACDEFGHIKLMNPQRSTVWY', 'n_terminus': 'H', 'c_terminus': 'OH', 'observed_mass': Peptide('DEFGHIKLNPQRSTVWY', 'H', 'OH').mass, 'tolerance': 3}
+
+    assert 'partial' not in solve_sample(sample)
+    assert solve_sample(sample, max_nodes=10 ** 6)['partial'] is False
+    assert solve_sample(sample, max_nodes=5)['partial'] is True
@@ -0,0 +1,37 @@
+from source import delta_finder
+from source.batch import solve_charge_states
+from source.charge_states import get_charge_assignments, get_charge_state_solutions
+from source.peptide import Peptide
+from source.search_stats import SearchStats
+
+def test_charge_assignments():
+    assignments = get_charge_assignments([500.5], [1, 2], ['H+', 'Na+'])
+
+    assert [(assignment['charge'], assignment['carrier']) for assignment in assignments] == [(1, 'H+'), (1, 'Na+'), (2, 'H+'), (2, 'Na+')]
+    assert abs(assignments[2]['observed_mass'] - 2 * (500.5 - 1.0073)) < 1e-9
+    assert get_charge_assignments([20], [1], ['K+']) == [] # Lighter than its carrier
+
+def test_charge_state_solutions():
+    desired_peptide = Peptide('ACDEFGHIKLMNPQRSTVWY', 'H', 'OH')
+    observed_mass = Peptide('ACDEFGHIKLNPQRSTVWY', 'H', 'OH').mass # Missing Met
+    mz = (observed_mass + 3 * 1.0073) / 3
+
+    stats = SearchStats()
+    charge_state_solutions = get_charge_state_solutions(desired_peptide, [mz], range(1, 9), .01, stats=stats)
+
+    assert [assignment['charge'] for assignment, _ in charge_state_solutions] == list(range(1, 9))
+    for assignment, solutions in charge_state_solutions:
+        assert assignment['tolerance'] == assignment['charge'] * .01
+        assert solutions == delta_finder.get_solutions(desired_peptide, desired_peptide.mass - assignment['observed_mass'], assignment['tolerance'])
+    assert [[delta.description for delta in solution.deltas] for solution in charge_state_solutions[2][1]] == [['M']]
+
+    # All of the charges are resolved in one search, which is cheaper than searching every charge separately
+    separate_nodes_expanded = 0
+    for assignment, _ in charge_state_solutions:
+        separate_stats = SearchStats()
+        delta_finder.get_solutions(desired_peptide, desired_peptide.mass - assignment['observed_mass'], assignment['tolerance'], stats=separate_stats)
+        separate_nodes_expanded += separate_stats.nodes_expanded
+    assert stats.nodes_expanded < separate_nodes_expanded
+
+    records = solve_charge_states('ACDEFGHIKLMNPQRSTVWY', 'H', 'OH', [mz], [3, 4], .01)
+    assert [(record['charge'], record['explained']) for record in records] == [(3, True), (4, False)]
@@ -1,9 +1,15 @@
-import json
-from source.delta_finder import get_solutions
+import itertools
+import pytest
+import random
+from source.delta_finder import get_solutions, iter_solutions, iter_top_solutions, get_multi_peak_solutions, get_deltas, generate_delta_sets, build_delta_index
 import signal
+import tracemalloc
 from source.peptide import Peptide
-from source.delta import Delta, DeltaType
-from source.delta_set import DeltaSet
+from source.delta import DeltaType
+from source.mass_windows import MassWindows
+from source.registry import get_registry
+from source.search_stats import SearchStats, measure_peak_memory
+from tests.reference_search import get_solutions_per_truncation
 
 class TimeoutException(Exception):
     pass
@@ -71,11 +77,229 @@ def test_find_possible_deltas_long_sequence():
 
     try: 
         signal.signal(signal.SIGALRM, timeout_handler)
-        # signal.alarm(30)
+        signal.alarm(30)
 
-        # deltas = get_solutions(desired_peptide, target_mass, 1)
+        solutions = get_solutions(desired_peptide, target_mass, 1, max_deletions=5)
 
         signal.alarm(0) # Disable alarm if function finishes on time
 
     except TimeoutException:
         assert 1 == 0
+
+    assert ['D', 'E', 'F', 'I', 'Q'] in [sorted(delta.description for delta in solution.deltas) for solution in solutions]
+
+def test_get_solutions_matches_per_truncation_search():
+    desired_sequence = 'ACDEFGHIKLMNPQRSTVWYGGSAKLM'
+    observed_sequence = 'DEFGHIKLNPQRSTVWYGGSAKLM' # Truncation of 'AC' and missing Met
+
+    desired_peptide = Peptide(desired_sequence, 'H', 'OH')
+    observed_peptide = Peptide(observed_sequence, 'H', 'OH')
+
+    target_mass = desired_peptide.mass - observed_peptide.mass
+
+    for confidence in [.5, 1, 3]:
+        solutions = get_solutions(desired_peptide, target_mass, confidence)
+        expected_solutions = get_solutions_per_truncation(desired_peptide, target_mass, confidence)
+
+        assert [repr(solution) for solution in solutions] == [repr(solution) for solution in expected_solutions]
+
+def test_delta_index_query():
+    deltas = get_deltas(Peptide('GAVLK', 'H', 'OH'))
+    index = build_delta_index(deltas, 0, 300)
+    delta_sets = generate_delta_sets(deltas, 150, 150)
+
+    assert len(index) == len(delta_sets)
+    assert index.query(100, 200) == [delta_set for delta_set in delta_sets if 100 <= delta_set.mass <= 200]
+    assert index.query(1000, 2000) == []
+
+def test_generate_delta_sets_repeated_residues():
+    # Every deletion of the same residue is one kind of delta that can be used as many times as it occurs
+    deltas = get_deltas(Peptide('GGGGGGGGGGAAAAAAAAAA', 'H', 'OH'))
+    glycine_mass = Peptide('G', 'H', 'OH').mass - Peptide('', 'H', 'OH').mass
+    alanine_mass = Peptide('A', 'H', 'OH').mass - Peptide('', 'H', 'OH').mass
+
+    delta_sets = generate_delta_sets(deltas, 2 * glycine_mass + alanine_mass, .01)
+
+    assert len(delta_sets) == 1
+    assert sorted(delta.description for delta in delta_sets[0].deltas) == ['A', 'G', 'G']
+
+    # Deletions beyond max_deletions or beyond the number of occurrences are not possible
+    assert generate_delta_sets(deltas, 3 * glycine_mass, .01, max_deletions=2) == []
+    assert generate_delta_sets(get_deltas(Peptide('GA', 'H', 'OH')), 2 * glycine_mass, .01) == []
+
+    # Every composition of up to max_deletions deletions is found exactly once
+    delta_sets = generate_delta_sets(deltas, 0, 10000, max_deletions=6)
+    assert len(delta_sets) == len(set(tuple(sorted(delta.description for delta in delta_set.deltas)) for delta_set in delta_sets))
+    assert len(delta_sets) == 28 # Every (alanine, glycine) count pair with at most 6 deletions
+
+def test_top_solutions():
+    desired_peptide = Peptide('ACDEFGHIKLMNPQRSTVWYGGSAKLM', 'H', 'OH')
+    observed_peptide = Peptide('DEFGHIKLNPQRSTVWYGGSAKLM', 'H', 'OH')
+    target_mass = desired_peptide.mass - observed_peptide.mass
+
+    solutions = get_solutions(desired_peptide, target_mass, 3)
+    ranked_solutions = sorted(solutions, key=lambda x: (x.likelihood, abs(x.mass - target_mass)))
+
+    for top_k in [1, 5, len(solutions), len(solutions) + 10]:
+        top_solutions = list(iter_top_solutions(desired_peptide, target_mass, 3, top_k))
+
+        assert len(top_solutions) == min(top_k, len(solutions))
+        assert [(x.likelihood, round(abs(x.mass - target_mass), 6)) for x in top_solutions] == [(x.likelihood, round(abs(x.mass - target_mass), 6)) for x in ranked_solutions[:top_k]]
+
+    assert [repr(x) for x in get_solutions(desired_peptide, target_mass, 3, top_k=5)] == [repr(x) for x in iter_top_solutions(desired_peptide, target_mass, 3, 5)]
+
+def test_multi_peak_solutions():
+    desired_peptide = Peptide('ACDEFGHIKLMNPQRSTVWYGGSAKLM', 'H', 'OH')
+    observed_sequences = ['DEFGHIKLNPQRSTVWYGGSAKLM', 'ACDEFGHIKLMNPQRSTVWYGGSAKL', 'ACDEFGHIKLMNPQRSTVWYGGSAKLM', 'ACDEGHIKLMNPQRSTVWYGSAKLM']
+    peaks = [(Peptide(sequence, 'H', 'OH').mass, confidence) for sequence in observed_sequences for confidence in [.5, 2]]
+    peaks.append((desired_peptide.mass + 500, 1)) # Heavier than expected, no solutions
+
+    peak_solutions = get_multi_peak_solutions(desired_peptide, peaks)
+
+    assert len(peak_solutions) == len(peaks)
+    assert peak_solutions[-1] == []
+    for (observed_mass, confidence), solutions in zip(peaks, peak_solutions):
+        expected_solutions = get_solutions(desired_peptide, desired_peptide.mass - observed_mass, confidence)
+        assert [repr(solution) for solution in solutions] == [repr(solution) for solution in expected_solutions]
+
+def test_mass_windows():
+    windows = MassWindows([(5, 6), (1, 2), (1.5, 3), (10, 9)])
+
+    assert list(zip(windows.min_masses, windows.max_masses)) == [(1, 3), (5, 6)]
+    assert windows.contains(1) and windows.contains(3) and windows.contains(5.5)
+    assert not windows.contains(4) and not windows.contains(.5) and not windows.contains(7)
+    assert windows.overlaps(3.5, 5) and not windows.overlaps(3.5, 4.5)
+    assert not MassWindows([]).overlaps(0, 100)
+
+def test_modifications():
+    all_types = set(DeltaType) - {DeltaType.TRUNCATION}
+    desired_peptide = Peptide('QMKWAGS', 'H', 'OH')
+    observed_peptide = Peptide('QMKWAGS', 'H', 'OH')
+
+    # Oxidized Met and a sodium adduct are only found when modifications are searched
+    target_mass = desired_peptide.mass - (observed_peptide.mass + 15.9994 + 21.9818)
+    assert all(delta.type == DeltaType.DELETION for solution in get_solutions(desired_peptide, target_mass, .01) for delta in solution.deltas)
+    solutions = get_solutions(desired_peptide, target_mass, .01, delta_types=all_types)
+    assert ['M oxidation', 'Na adduct'] in [sorted(delta.description for delta in solution.deltas) for solution in solutions]
+
+    # Pyroglutamate only forms from an N-terminal Gln with a free amine, and Fmoc only remains on a free amine
+    assert [delta.type for delta in get_deltas(desired_peptide, {DeltaType.PYROGLUTAMATE})] == [DeltaType.PYROGLUTAMATE]
+    assert get_deltas(Peptide('MQ', 'H', 'OH'), {DeltaType.PYROGLUTAMATE}) == []
+    assert get_deltas(Peptide('QM', 'Acetyl N-cap', 'OH'), {DeltaType.PYROGLUTAMATE, DeltaType.INCOMPLETE_FMOC_REMOVAL}) == []
+
+    # Each class is capped, so three adducts are never found
+    deltas = get_deltas(desired_peptide, {DeltaType.ADDUCT})
+    assert generate_delta_sets(deltas, -2 * 21.9818, .01) != []
+    assert generate_delta_sets(deltas, -3 * 21.9818, .01) == []
+
+def test_modifications_match_exhaustive_search():
+    # The block-wise search finds exactly the combinations that respect max_deletions and the cap of every class
+    peptide = Peptide('QMKSW', 'H', 'OH')
+    deltas = get_deltas(peptide, set(DeltaType) - {DeltaType.TRUNCATION})
+    caps = get_registry().delta_caps
+    expected = set()
+    for r in range(len(deltas) + 1):
+        for combination in itertools.combinations(range(len(deltas)), r):
+            types = [deltas[i].type for i in combination]
+            if types.count(DeltaType.DELETION) <= 2 and all(types.count(delta_type) <= cap for delta_type, cap in caps.items()):
+                mass = sum(deltas[i].mass for i in combination)
+                if -100 <= mass <= 100:
+                    expected.add(tuple(sorted(deltas[i].description for i in combination)))
+
+    delta_sets = generate_delta_sets(deltas, 0, 100, max_deletions=2)
+
+    assert len(delta_sets) == len(expected)
+    assert set(tuple(sorted(delta.description for delta in delta_set.deltas)) for delta_set in delta_sets) == expected
+
+def test_modifications_top_solutions():
+    all_types = set(DeltaType) - {DeltaType.TRUNCATION}
+    desired_peptide = Peptide('ACDEFGHIKLMNPQRSTVWYGGSAKLM', 'H', 'OH')
+    target_mass = desired_peptide.mass - Peptide('CDEFGHIKLMNPQRSTVWYGGSAKLM', 'H', 'OH').mass - 15.9994
+
+    solutions = get_solutions(desired_peptide, target_mass, .01, max_deletions=2, delta_types=all_types)
+    ranked_solutions = sorted(solutions, key=lambda x: (x.likelihood, abs(x.mass - target_mass)))
+    top_solutions = get_solutions(desired_peptide, target_mass, .01, max_deletions=2, top_k=10, delta_types=all_types)
+
+    assert [(x.likelihood, round(abs(x.mass - target_mass), 6)) for x in top_solutions] == [(x.likelihood, round(abs(x.mass - target_mass), 6)) for x in ranked_solutions[:10]]
+
+def test_modifications_top_solutions_of_truncations():
+    # The best completions of a truncation can need residues it removed, and must not crowd out the ones that fit
+    all_types = set(DeltaType) - {DeltaType.TRUNCATION}
+    random.seed(3)
+    cases = [('TNWK', 337.075)] + [(''.join(random.choice('ACDEFGHIKLMNPQRSTVWY') for _ in range(random.randint(4, 10))), random.uniform(50, 500)) for _ in range(40)]
+    for sequence, target_mass in cases:
+        peptide = Peptide(sequence, 'H', 'OH')
+        solutions = get_solutions(peptide, target_mass, 2, delta_types=all_types)
+        ranked_solutions = sorted(solutions, key=lambda x: (x.likelihood, abs(x.mass - target_mass)))
+        for top_k in [1, 3]:
+            top_solutions = get_solutions(peptide, target_mass, 2, top_k=top_k, delta_types=all_types)
+            assert [(x.likelihood, round(abs(x.mass - target_mass), 6)) for x in top_solutions] == [(x.likelihood, round(abs(x.mass - target_mass), 6)) for x in ranked_solutions[:top_k]]
+
+def test_node_budget():
+    desired_peptide = Peptide('ACDEFGHIKLMNPQRSTVWYGGSAKLM', 'H', 'OH')
+    target_mass = desired_peptide.mass - Peptide('DEFGHIKLNPQRSTVWYGGSAKLM', 'H', 'OH').mass
+
+    stats = SearchStats()
+    solutions = get_solutions(desired_peptide, target_mass, 3, stats=stats)
+    assert not stats.partial
+
+    # A budget that covers the whole search changes nothing
+    budget_stats = SearchStats(max_nodes=stats.nodes_expanded)
+    assert [repr(x) for x in get_solutions(desired_peptide, target_mass, 3, stats=budget_stats)] == [repr(x) for x in solutions]
+    assert not budget_stats.partial
+
+    # A smaller budget stops the search with the solutions found so far
+    budget_stats = SearchStats(max_nodes=stats.nodes_expanded // 2)
+    partial_solutions = get_solutions(desired_peptide, target_mass, 3, stats=budget_stats)
+    assert budget_stats.partial and budget_stats.nodes_expanded == stats.nodes_expanded // 2
+    assert 0 < len(partial_solutions) < len(solutions)
+    assert set(repr(x) for x in partial_solutions) <= set(repr(x) for x in solutions)
+
+    budget_stats = SearchStats(max_nodes=10)
+    assert len(get_solutions(desired_peptide, target_mass, 3, top_k=1000, stats=budget_stats)) < len(solutions)
+    assert budget_stats.partial
+
+def test_negative_max_deletions():
+    peptide = Peptide('ACDEFGHIKLMNPQRSTVWY', 'H', 'OH')
+
+    with pytest.raises(ValueError):
+        get_solutions(peptide, 300, 1, max_deletions=-1)
+    with pytest.raises(ValueError):
+        get_solutions(peptide, 300, 1, max_deletions=-1, top_k=5)
+
+def test_streaming_memory_is_flat():
+    # Consuming the solutions one at a time keeps peak memory flat however many nodes are explored
+    peptide = Peptide('ACDEFGHIKLMNPQRSTVWY' * 10, 'H', 'OH')
+    peaks = []
+    for max_nodes in [2000, 20000]:
+        stats = SearchStats(max_nodes=max_nodes)
+        tracemalloc.start()
+        solutions = sum(1 for _ in iter_solutions(peptide, 800, 100, max_deletions=6, stats=stats))
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        assert stats.partial and solutions > 0
+
+    assert peaks[1] < 2 * peaks[0]
+
+def test_profile():
+    desired_peptide = Peptide('ACDEFGHIKLMNPQRSTVWYGGSAKLM', 'H', 'OH')
+    observed_peptide = Peptide('DEFGHIKLNPQRSTVWYGGSAKLM', 'H', 'OH')
+    target_mass = desired_peptide.mass - observed_peptide.mass
+
+    stats = SearchStats()
+    profiled_stats = SearchStats(profile=True)
+    solutions = get_solutions(desired_peptide, target_mass, 2, stats=stats)
+    assert [x.to_dict() for x in get_solutions(desired_peptide, target_mass, 2, stats=profiled_stats)] == [x.to_dict() for x in solutions]
+
+    # Profiling adds its report without changing the search
+    profile = profiled_stats.to_dict()
+    assert set(stats.to_dict()) == {'nodes_expanded', 'solutions', 'partial'}
+    assert {key: profile[key] for key in stats.to_dict()} == stats.to_dict()
+    assert set(profile['timings']) == {'delta_space', 'truncations', 'search'}
+    assert sum(truncation['nodes_expanded'] for truncation in profile['truncations']) == stats.nodes_expanded
+    assert sum(truncation['solutions'] for truncation in profile['truncations']) == len(solutions)
+    assert profile['max_stack'] > 0 and profile['branches_pruned'] > 0 and profile['max_rss_bytes'] > 0
+
+    # Allocations are only traced by a separate pass, never while the search is timed
+    assert profile['peak_bytes'] is None and not tracemalloc.is_tracing()
+    assert measure_peak_memory(lambda: get_solutions(desired_peptide, target_mass, 2)) > 0
@@ -0,0 +1,35 @@
+import pickle
+import pytest
+from source.delta import Delta, DeltaType
+from source.delta_set import DeltaSet
+
+def test_deltas_are_interned():
+    glycine = Delta(57.0518, DeltaType.DELETION, 1, 'G')
+
+    assert Delta(57.0518, DeltaType.DELETION, 1, 'G') is glycine
+    assert Delta.from_dict(glycine.to_dict()) is glycine
+    assert pickle.loads(pickle.dumps(glycine)) is glycine
+    assert Delta(57.0518, DeltaType.DELETION, 2, 'G') != glycine
+    assert not hasattr(glycine, '__dict__')
+
+    with pytest.raises(ValueError):
+        Delta(57.0518, 'DELETION', 1, 'G')
+
+def test_delta_set_equality():
+    glycine = Delta(57.0518, DeltaType.DELETION, 1, 'G')
+    alanine = Delta(71.0786, DeltaType.DELETION, 1, 'A')
+    oxidation = Delta(-15.9994, DeltaType.OXIDATION, 1, 'M oxidation')
+
+    delta_set = DeltaSet((glycine, alanine, oxidation))
+    assert delta_set.mass == 112.131 and delta_set.likelihood == 3
+
+    # Equality depends on the deltas, not their order or the hash of their descriptions
+    assert delta_set == DeltaSet((oxidation, glycine, alanine))
+    assert hash(delta_set) == hash(DeltaSet((oxidation, glycine, alanine)))
+    assert delta_set != DeltaSet((glycine, alanine))
+    assert DeltaSet((glycine, glycine)) != DeltaSet((glycine,))
+    assert DeltaSet((Delta(71.0786, DeltaType.DELETION, 1, 'G'),)) != DeltaSet((glycine,))
+    assert len({delta_set, DeltaSet((alanine, oxidation, glycine)), DeltaSet((glycine,))}) == 2
+
+    assert pickle.loads(pickle.dumps(delta_set)) == delta_set
+    assert DeltaSet.from_dict(delta_set.to_dict()) == delta_set
@@ -0,0 +1,43 @@
+import random
+from source.fragment_sweep import get_fragments, get_prefix_units
+from source.mass_units import to_units
+from source.peptide import Peptide
+
+def get_fragments_brute_force(peptide, target_mass, confidence):
+    fragments = []
+    for start in range(len(peptide.sequence)):
+        for end in range(start + 1, len(peptide.sequence) + 1):
+            if (start, end) == (0, len(peptide.sequence)):
+                continue
+            fragment = Peptide(peptide.sequence[start:end], peptide.n_termini_species, peptide.c_termini_species)
+            if abs(peptide.mass_units - fragment.mass_units - to_units(target_mass)) <= to_units(confidence):
+                fragments.append((start, end))
+    return fragments
+
+def test_prefix_units():
+    prefix_units = get_prefix_units('KAY')
+
+    assert len(prefix_units) == 4
+    assert prefix_units[0] == 0
+    assert prefix_units[-1] == Peptide('KAY', 'H', 'OH').mass_units - Peptide('', 'H', 'OH').mass_units
+
+def test_get_fragments_matches_brute_force():
+    random.seed(0)
+    sequence = ''.join(random.choice('ACDEFGHIKLMNPQRSTVWY') for _ in range(60))
+    peptide = Peptide(sequence, 'H', 'OH')
+
+    for start, end in [(5, 60), (0, 52), (7, 41)]:
+        target_mass = peptide.mass - Peptide(sequence[start:end], 'H', 'OH').mass
+        fragments = get_fragments(peptide, target_mass, 2)
+
+        assert (start, end) in fragments
+        assert fragments == get_fragments_brute_force(peptide, target_mass, 2)
+
+def test_get_fragments_by_kind():
+    peptide = Peptide('GGGGG', 'H', 'OH')
+    target_mass = peptide.mass - Peptide('GGG', 'H', 'OH').mass
+
+    assert get_fragments(peptide, target_mass, .01) == [(0, 3), (1, 4), (2, 5)]
+    assert get_fragments(peptide, target_mass, .01, c_terminal=False, internal=False) == [(2, 5)]
+    assert get_fragments(peptide, target_mass, .01, n_terminal=False, internal=False) == [(0, 3)]
+    assert get_fragments(peptide, target_mass, .01, n_terminal=False, c_terminal=False) == [(1, 4)]
@@ -0,0 +1,51 @@
+from source import delta_finder
+from source.batch import solve_library, solve_sample
+from source.delta import DeltaType
+from source.library_search import get_library_solutions
+from source.peptide import Peptide
+from source.prefix_trie import PrefixTrie
+from source.search_stats import SearchStats
+
+BASE = 'ACDEFGHIKLMNPQRSTVWY'
+
+def get_alanine_scan():
+    samples = []
+    for i, residue in enumerate(BASE):
+        sequence = BASE[:i] + 'A' + BASE[i + 1:]
+        # Every variant is missing a different residue or N-terminal prefix
+        observed_peptide = Peptide(sequence[:i % 5] + sequence[i % 5 + 1:] if i % 2 else sequence[i % 3:], 'H', 'OH')
+        samples.append((sequence, 'H', 'OH', observed_peptide.mass, .5))
+    return samples
+
+def get_ids(solutions):
+    return sorted(solution.ids for solution in solutions)
+
+def test_prefix_trie():
+    trie = PrefixTrie()
+    assert trie.insert('ACD') == [0] + [Peptide(BASE[:i], 'H', 'OH').mass_units - Peptide('', 'H', 'OH').mass_units for i in range(1, 4)]
+    trie.insert('ACE')
+    assert trie.nodes == 5
+
+def test_library_matches_independent_searches():
+    samples = get_alanine_scan()
+    for delta_types in [None, {DeltaType.DELETION, DeltaType.OXIDATION, DeltaType.DEAMIDATION}]:
+        stats = SearchStats()
+        independent_stats = SearchStats()
+        library_solutions = get_library_solutions(samples, stats=stats, delta_types=delta_types)
+        for (sequence, n_terminus, c_terminus, observed_mass, confidence), solutions in zip(samples, library_solutions):
+            peptide = Peptide(sequence, n_terminus, c_terminus)
+            expected = delta_finder.get_solutions(peptide, peptide.mass - observed_mass, confidence, stats=independent_stats, delta_types=delta_types)
+            assert expected and get_ids(solutions) == get_ids(expected)
+        assert stats.nodes_expanded < independent_stats.nodes_expanded
+
+def test_solve_library():
+    samples = [{'sequence': sequence, 'n_terminus': n_terminus, 'c_terminus': c_terminus, 'observed_mass': observed_mass, 'tolerance': confidence} for sequence, n_terminus, c_terminus, observed_mass, confidence in get_alanine_scan()[:4]]
+    samples.insert(2, {'sequence': 'AJ', 'n_terminus': 'H', 'c_terminus': 'OH', 'observed_mass': 100, 'tolerance': 1})
+    records = solve_library(samples)
+
+    assert 'error' in records[2]
+    for sample, record in zip(samples, records):
+        if 'error' not in record:
+            expected = solve_sample(sample)
+            assert {key: value for key, value in record.items() if key != 'solutions'} == {key: value for key, value in expected.items() if key != 'solutions'}
+            assert sorted(map(str, record['solutions'])) == sorted(map(str, expected['solutions']))
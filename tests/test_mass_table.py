@@ -0,0 +1,43 @@
+import math
+import pytest
+from source import delta_finder
+from source.batch import solve_sample
+from source.mass_table import MassTable, write_mass_table
+from source.peptide import Peptide
+from source.registry import get_registry
+
+@pytest.fixture(scope='module')
+def mass_table_path(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('mass_table') / 'mass-combinations.bin')
+    write_mass_table(path, get_registry(), 4)
+    return path
+
+def test_mass_table_is_sorted(mass_table_path):
+    table = MassTable(mass_table_path)
+    residues = len(table.alphabet)
+
+    assert len(table) == math.comb(residues + 4, 4)
+    assert list(table.mass_units) == sorted(table.mass_units)
+    assert table.get_composition(0) == ()
+
+def test_table_solutions_match_search(mass_table_path):
+    table = MassTable(mass_table_path)
+    desired_peptide = Peptide('ACDEFGHIKLMNPQRSTVWYGGSAKLM', 'H', 'OH')
+    observed_peptide = Peptide('DEFGHIKLNPQRSTVWYGGSAKLM', 'H', 'OH')
+    target_mass = desired_peptide.mass - observed_peptide.mass
+
+    for max_deletions in [1, 2, 4]:
+        solutions = delta_finder.get_solutions(desired_peptide, target_mass, 3, max_deletions)
+        assert [x.to_dict() for x in delta_finder.get_solutions(desired_peptide, target_mass, 3, max_deletions, mass_table=table)] == [x.to_dict() for x in solutions]
+
+    # The table cannot answer for more deletions than it holds
+    with pytest.raises(ValueError):
+        delta_finder.get_solutions(desired_peptide, target_mass, 3, 5, mass_table=table)
+    # Nor for only the most likely solutions
+    with pytest.raises(ValueError):
+        delta_finder.get_solutions(desired_peptide, target_mass, 3, top_k=3, mass_table=table)
+
+def test_solve_sample_with_mass_table(mass_table_path):
+    sample = {'sequence': 'GGSGGSAK', 'n_terminus': 'H', 'c_terminus': 'OH', 'observed_mass': 400, 'tolerance': 2}
+
+    assert solve_sample(sample, mass_table_path=mass_table_path) == solve_sample(sample)
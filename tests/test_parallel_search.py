@@ -0,0 +1,33 @@
+from concurrent.futures import ProcessPoolExecutor
+from source import delta_finder
+from source.delta import DeltaType
+from source.parallel_search import get_parallel_solutions, pack_chunks
+from source.peptide import Peptide
+from source.search_stats import SearchStats
+
+def test_parallel_solutions_match_serial():
+    desired_peptide = Peptide('ACDEFGHIKLMNPQRSTVWYGGSAKLM', 'H', 'OH')
+    target_mass = desired_peptide.mass - Peptide('DEFGHIKLNPQRSTVWYGGSAKLM', 'H', 'OH').mass
+    queries = [
+        (desired_peptide, target_mass, 3, None),
+        (Peptide('ACDEFGHIKLMNPQRSTVWY' * 5, 'H', 'OH'), 400, 2, None),
+        (Peptide('QMNKWSTEACDEF', 'H', 'OH'), 100, .05, set(DeltaType) - {DeltaType.TRUNCATION}),
+        (desired_peptide, -500, 1, None), # No solutions
+    ]
+
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        for peptide, target_mass, confidence, delta_types in queries:
+            serial_stats, parallel_stats = SearchStats(), SearchStats()
+            serial_solutions = delta_finder.get_solutions(peptide, target_mass, confidence, stats=serial_stats, delta_types=delta_types)
+            parallel_solutions = get_parallel_solutions(peptide, target_mass, confidence, stats=parallel_stats, delta_types=delta_types, processes=2, executor=executor)
+
+            assert [repr(x) for x in parallel_solutions] == [repr(x) for x in serial_solutions]
+            assert [x.to_dict() for x in parallel_solutions] == [x.to_dict() for x in serial_solutions]
+            assert parallel_stats.to_dict() == serial_stats.to_dict()
+
+def test_pack_chunks():
+    sizes = [10, 1, 1, 1, 7, 3, 3, 2]
+    chunks = pack_chunks(list(range(len(sizes))), sizes, 3)
+
+    assert sorted(unit for chunk in chunks for unit in chunk) == list(range(len(sizes)))
+    assert [sum(sizes[unit] for unit in chunk) for chunk in chunks] == [10, 9, 9]
@@ -1,4 +1,3 @@
-import json
 from source.peptide import Peptide
 
 def test_calc_sequence_mass_full_length_natural_peptide():
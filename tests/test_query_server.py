@@ -0,0 +1,123 @@
+import asyncio
+import json
+import threading
+from source.batch import solve_sample
+from source.query_server import QueryServer
+
+SAMPLE = {'sequence': 'ACDEFGHIKLMNPQRSTVWYGGSAKLM', 'n_terminus': 'H', 'c_terminus': 'OH', 'observed_mass': 2700, 'tolerance': 2}
+
+async def send(path: str, requests: list[dict]):
+    '''
+    Sends the requests on one connection and gets the responses by id.
+    '''
+    reader, writer = await asyncio.open_unix_connection(path, limit=2 ** 24)
+    for i, request in enumerate(requests):
+        writer.write(json.dumps(request | {'id': i}).encode() + b'\n')
+    await writer.drain()
+    writer.write_eof()
+    responses = [json.loads(line) for line in [await reader.readline() for _ in requests]]
+    writer.close()
+    return [response for response in sorted(responses, key=lambda x: x.pop('id'))]
+
+def test_query_server_answers_like_batch(tmp_path):
+    async def run():
+        server = QueryServer()
+        async with await server.start(str(tmp_path / 'server.sock')):
+            responses = await send(str(tmp_path / 'server.sock'), [SAMPLE, SAMPLE | {'observed_mass': 2650}, {'sequence': 'J'}, {'op': 'health'}])
+            # The second connection finds the peptide warm
+            responses += await send(str(tmp_path / 'server.sock'), [SAMPLE | {'tolerance': 1, 'top_k': 3}, {'op': 'metrics'}])
+        return server, responses
+
+    server, responses = asyncio.run(run())
+
+    assert responses[0] == solve_sample(SAMPLE)
+    assert responses[1] == solve_sample(SAMPLE | {'observed_mass': 2650})
+    assert 'error' in responses[2]
+    assert responses[3]['status'] == 'ok'
+    assert responses[4] == solve_sample(SAMPLE | {'tolerance': 1}, top_k=3)
+    assert responses[5]['requests'] == 6 and responses[5]['errors'] == 1
+    assert server.counters['peptide_hits'] >= 1 and len(server.delta_spaces) == 1
+
+def test_query_server_rejects_invalid_queries(tmp_path):
+    invalid = [{'max_deletions': -1}, {'max_deletions': 1.5}, {'top_k': -2}, {'max_nodes': 'many'}, {'tolerance': 'inf'}, {'tolerance': -1}, {'observed_mass': 'nan'}]
+
+    async def run():
+        server = QueryServer()
+        async with await server.start(str(tmp_path / 'server.sock')):
+            responses = await send(str(tmp_path / 'server.sock'), [SAMPLE | fields for fields in invalid] + [{'op': 'health'}])
+        return server, responses
+
+    server, responses = asyncio.run(run())
+
+    assert all('error' in response for response in responses[:-1])
+    assert responses[-1]['status'] == 'ok'
+    assert server.counters['errors'] == len(invalid)
+
+def test_query_server_answers_unexpected_errors():
+    async def run():
+        server = QueryServer()
+        async def fail(request):
+            raise IndexError('list index out of range')
+        server.solve = fail
+        return server, await server.respond(SAMPLE | {'id': 7})
+
+    server, response = asyncio.run(run())
+
+    assert response == {'error': 'IndexError: list index out of range', 'id': 7}
+    assert server.counters['errors'] == 1
+
+def test_query_server_coalesces_identical_queries():
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow_search(*args):
+        calls.append(args)
+        started.set()
+        release.wait(5)
+        return 'result'
+
+    async def run():
+        server = QueryServer()
+        first = asyncio.create_task(server.coalesce(('key',), server.run_in_thread, slow_search))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+        second = asyncio.create_task(server.coalesce(('key',), server.run_in_thread, slow_search))
+        await asyncio.sleep(0)
+        release.set()
+        return server, await first, await second
+
+    server, first, second = asyncio.run(run())
+
+    assert first == second == 'result'
+    assert len(calls) == 1 and server.counters['coalesced'] == 1 and not server.in_flight
+
+def test_query_server_offloads_heavy_searches(tmp_path):
+    # A search of a few seconds with few solutions, which a thread would stop at the node budget
+    heavy = {'sequence': 'ACDEFGHIKLMNPQRSTVWY' * 3, 'n_terminus': 'H', 'c_terminus': 'OH', 'observed_mass': 6000, 'tolerance': 0.05, 'max_deletions': 8}
+
+    async def run():
+        server = QueryServer()
+        path = str(tmp_path / 'server.sock')
+        completed = []
+        async def send_named(name: str, requests: list[dict]):
+            responses = await send(path, requests)
+            completed.append(name)
+            return responses
+        async with await server.start(path):
+            await send(path, [SAMPLE]) # Warms the sample's peptide
+            heavy_task = asyncio.create_task(send_named('heavy', [heavy]))
+            # Waits until the heavy search has left its thread for a process
+            while not server.counters['offloaded']:
+                await asyncio.sleep(0.01)
+            responses = await send_named('light', [SAMPLE | {'observed_mass': 2650}, {'op': 'health'}])
+            heavy_response = (await heavy_task)[0]
+        server.process_executor.shutdown()
+        return server, responses, completed, heavy_response
+
+    server, responses, completed, heavy_response = asyncio.run(run())
+
+    # The warm query and the health check are answered while the heavy search runs in a process
+    assert completed == ['light', 'heavy']
+    assert responses[0] == solve_sample(SAMPLE | {'observed_mass': 2650})
+    assert responses[1]['status'] == 'ok'
+    assert server.counters['offloaded'] == 1
+    assert heavy_response['solutions'] and 'partial' not in heavy_response
@@ -0,0 +1,55 @@
+import itertools
+import random
+from source.delta import DeltaType
+from source.delta_finder import get_delta_space, get_solutions
+from source.mass_units import to_units
+from source.mass_windows import MassWindows
+from source.peptide import Peptide
+from source.reachable_masses import ReachableMasses
+from source.search_stats import SearchStats
+
+def test_reachable_masses_matches_brute_force():
+    # Two blocks with mixed signs and caps: deletions of 3 kinds (at most 2) and modifications of 2 kinds (at most 1)
+    deletions = [(57051800, 2), (71078600, 1), (186212800, 1)]
+    modifications = [(-15999400, 1), (-21981800, 1)]
+    reachable = ReachableMasses([(2, deletions), (1, modifications)])
+
+    masses = set()
+    deletion_items = [mass for mass, count in deletions for _ in range(count)]
+    for r in range(3):
+        for taken in itertools.combinations(deletion_items, r):
+            for modification in [0] + [mass for mass, _ in modifications]:
+                masses.add(sum(taken) + modification)
+
+    for mass in masses:
+        assert reachable.overlaps(mass, mass)
+
+    # Windows far from every reachable mass are rejected
+    rng = random.Random(0)
+    for _ in range(200):
+        mass = rng.randrange(-50000000, 400000000)
+        if all(abs(mass - reachable_mass) > 10000 for reachable_mass in masses):
+            assert not reachable.overlaps(mass - 1000, mass + 1000)
+
+def test_unexplained_query_returns_before_search():
+    peptide = Peptide('GGGGGGGGGG', 'H', 'OH')
+    delta_space = get_delta_space(peptide)
+
+    # 100 Da is within the bounds of up to 4 glycines but no combination of them weighs it
+    stats = SearchStats()
+    assert delta_space.get_delta_sets(99.99, 100.01, stats) == []
+    assert stats.nodes_expanded == 0
+    assert not delta_space.can_reach(MassWindows([(to_units(99.99), to_units(100.01))]))
+
+    stats = SearchStats()
+    assert get_solutions(peptide, 100, .01, stats=stats) == []
+    assert stats.nodes_expanded == 0
+
+def test_integer_masses_are_exact():
+    # Three missing glycines and an oxidation match a window of zero width, which float sums would miss
+    peptide = Peptide('GGGGGMGGGG', 'H', 'OH')
+    target_mass = 3 * 57.0518 - 15.9994
+    solutions = get_solutions(peptide, target_mass, 0, delta_types={DeltaType.DELETION, DeltaType.OXIDATION})
+
+    assert ['G', 'G', 'G', 'M oxidation'] in [sorted(delta.description for delta in solution.deltas) for solution in solutions]
+    assert all(solution.mass == 155.156 for solution in solutions)
@@ -0,0 +1,70 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import pytest
+from source.delta import DeltaType
+from source.registry import DATA_DIRECTORY, Registry, get_registry
+
+def test_get_registry():
+    registry = get_registry()
+
+    assert registry is get_registry()
+    assert abs(registry.residue_masses['G'] - 57.0518) <= .0001
+    assert registry.mass_table[ord('G')] == registry.residue_masses['G']
+    assert registry.termini_species_masses['OH'] == 17.0073
+    assert [delta.type for delta in registry.residue_deltas['G']] == [DeltaType.DELETION]
+    assert 'Z' in registry.non_canonicals and 'G' not in registry.non_canonicals
+    assert registry.delta_caps[DeltaType.OXIDATION] == 2
+    assert registry.delta_classes[DeltaType.ADDUCT]['position'] == 'peptide'
+
+    with pytest.raises(TypeError):
+        registry.residue_masses['G'] = 0
+
+def test_registry_cache(tmp_path):
+    data_directory = tmp_path / 'data'
+    shutil.copytree(DATA_DIRECTORY, data_directory)
+    cache_path = tmp_path / 'registry.pickle'
+
+    registry = Registry.load(data_directory, cache_path)
+    assert os.path.exists(cache_path) and not list(tmp_path.glob('*.tmp'))
+    assert Registry.load(data_directory, cache_path).residue_masses == registry.residue_masses
+
+    # Editing the tables invalidates the cache
+    residues = json.loads((data_directory / 'residues.json').read_text())
+    residues['G']['mass'] = 100
+    (data_directory / 'residues.json').write_text(json.dumps(residues))
+
+    assert Registry.load(data_directory, cache_path).residue_masses['G'] == 100
+    assert Registry.load(data_directory, cache_path).data_hash != registry.data_hash
+
+def test_registry_validation():
+    residues = json.loads(open(os.path.join(DATA_DIRECTORY, 'residues.json')).read())
+    termini_species_masses = json.loads(open(os.path.join(DATA_DIRECTORY, 'termini_species.json')).read())
+    delta_classes = json.loads(open(os.path.join(DATA_DIRECTORY, 'delta_classes.json')).read())
+
+    # Modifications of residues need their class
+    with pytest.raises(ValueError):
+        Registry(residues, termini_species_masses)
+
+    delta_classes['ADDUCT']['position'] = 'residue'
+    with pytest.raises(ValueError):
+        Registry(residues, termini_species_masses, delta_classes)
+    delta_classes['ADDUCT']['position'] = 'peptide'
+
+    residues['G']['deltas'][0]['type'] = 'UNKNOWN'
+    with pytest.raises(ValueError):
+        Registry(residues, termini_species_masses, delta_classes)
+
+    del residues['G']['mass']
+    with pytest.raises(ValueError):
+        Registry(residues, termini_species_masses, delta_classes)
+
+def test_import_from_another_directory(tmp_path):
+    root = os.path.dirname(DATA_DIRECTORY)
+    code = "from source.peptide import Peptide; print(round(Peptide('KAY', 'H', 'OH').mass, 2))"
+
+    output = subprocess.run([sys.executable, '-c', code], cwd=tmp_path, env={**os.environ, 'PYTHONPATH': root}, capture_output=True, text=True, check=True).stdout
+
+    assert output.strip() == '380.44'
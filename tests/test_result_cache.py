@@ -0,0 +1,59 @@
+from source import delta_finder
+from source.batch import run_batch
+from source.peptide import Peptide
+from source.result_cache import ResultCache
+
+def get_query():
+    desired_peptide = Peptide('ACDEFGHIKLMNPQRSTVWYGGSAKLM', 'H', 'OH')
+    observed_peptide = Peptide('DEFGHIKLNPQRSTVWYGGSAKLM', 'H', 'OH')
+    # Rounded to the mass quantum of the cache, so that queries a fraction of a quantum away share its entry
+    return desired_peptide, round(desired_peptide.mass - observed_peptide.mass, 3)
+
+def test_result_cache_hits(tmp_path, monkeypatch):
+    peptide, target_mass = get_query()
+    cache = ResultCache(tmp_path / 'cache.sqlite')
+
+    solutions = cache.get_solutions(peptide, target_mass, 2)
+    assert len(cache) == 1
+    assert [x.to_dict() for x in solutions] == [x.to_dict() for x in delta_finder.get_solutions(peptide, target_mass, 2)]
+
+    # Identical and near-identical queries (within half a quantum either way) are answered from the cache, even from
+    # another connection
+    monkeypatch.setattr(delta_finder, 'get_solutions', None)
+    for offset in [0, .0002, -.0002]:
+        assert [x.to_dict() for x in ResultCache(tmp_path / 'cache.sqlite').get_solutions(peptide, target_mass + offset, 2)] == [x.to_dict() for x in solutions]
+    assert len(cache) == 1
+
+def test_result_cache_invalidated_by_tables(tmp_path):
+    peptide, target_mass = get_query()
+
+    ResultCache(tmp_path / 'cache.sqlite').get_solutions(peptide, target_mass, 2)
+    ResultCache(tmp_path / 'cache.sqlite', data_hash='edited tables').get_solutions(peptide, target_mass, 2)
+
+    assert len(ResultCache(tmp_path / 'cache.sqlite')) == 2
+
+def test_result_cache_eviction(tmp_path):
+    cache = ResultCache(tmp_path / 'cache.sqlite', max_bytes=30)
+
+    for key in ['a', 'b', 'c']:
+        cache.put(key, 'x' * 10)
+    assert len(cache) == 3
+
+    # Using the first entry makes the second one the least recently used
+    cache.get('a')
+    cache.put('d', 'x' * 10)
+
+    assert [key for key in 'abcd' if cache.get(key)] == ['a', 'c', 'd']
+
+    # An entry larger than max_bytes on its own is kept until the next insertion
+    cache.put('e', 'x' * 100)
+    assert [key for key in 'abcde' if cache.get(key)] == ['e']
+
+def test_result_cache_concurrent_workers(tmp_path):
+    cache_path = str(tmp_path / 'cache.sqlite')
+    samples = [{'sequence': 'KAY' * (i % 4 + 1), 'n_terminus': 'H', 'c_terminus': 'OH', 'observed_mass': 300 + i % 8, 'tolerance': 1} for i in range(40)]
+
+    records = list(run_batch(iter(samples), processes=4, cache_path=cache_path))
+
+    assert records == list(run_batch(iter(samples), processes=4))
+    assert len(ResultCache(cache_path)) == 8
@@ -0,0 +1,46 @@
+import math
+from source import delta_finder
+from source.delta import DeltaType
+from source.peptide import Peptide
+
+def test_grouped_deletions_of_a_linker():
+    # Every pair of the twelve glycines of the linker is one grouped solution
+    peptide = Peptide('GGGGSGGGGSGGGGK', 'H', 'OH')
+    glycine = peptide.mass - Peptide('GGGGSGGGGSGGGK', 'H', 'OH').mass
+    solutions = delta_finder.get_solutions(peptide, 2 * glycine, .01, max_deletions=2)
+    groups = [delta_finder.group_solution(peptide, solution) for solution in solutions if all(delta.type == DeltaType.DELETION for delta in solution.deltas)]
+
+    assert len(groups) == 1
+    assert groups[0].count_placements() == math.comb(12, 2)
+    placements = list(groups[0].iter_placements())
+    assert len(placements) == len(set(placements)) == math.comb(12, 2)
+    assert all(peptide.sequence[position] == 'G' for placement in placements for position, _ in placement)
+
+def test_grouped_truncation_excludes_truncated_positions():
+    peptide = Peptide('GGAGG', 'H', 'OH')
+    truncation = Peptide('AGG', 'H', 'OH')
+    glycine = peptide.mass - Peptide('GAGG', 'H', 'OH').mass
+    solutions = delta_finder.get_solutions(peptide, peptide.mass - truncation.mass + glycine, .001, max_deletions=1)
+    groups = [delta_finder.group_solution(peptide, solution) for solution in solutions if len(solution.deltas) == 2]
+
+    assert len(groups) == 1 and groups[0].truncated == 2
+    assert list(groups[0].iter_placements()) == [((3, groups[0].delta_set.deltas[0]),), ((4, groups[0].delta_set.deltas[0]),)]
+
+def test_overlapping_positions_are_placed_on_distinct_residues():
+    peptide = Peptide('MAMKM', 'H', 'OH')
+    solution = next(x for x in delta_finder.get_solutions(peptide, 0, 300, max_deletions=1, delta_types={DeltaType.DELETION, DeltaType.OXIDATION}) if {delta.description for delta in x.deltas} == {'M', 'M oxidation'})
+    group = delta_finder.group_solution(peptide, solution)
+
+    # One of the three methionines is deleted and another is oxidized
+    assert group.count_placements() == 6
+    assert all(len({position for position, _ in placement}) == 2 for placement in group.iter_placements())
+
+def test_truncated_residues_are_not_also_deleted():
+    # Truncating WA and deleting the only W would need the W twice
+    peptide = Peptide('WAGGGK', 'H', 'OH')
+    tryptophan = peptide.mass - Peptide('AGGGK', 'H', 'OH').mass
+    solutions = delta_finder.get_solutions(peptide, peptide.mass - Peptide('GGGK', 'H', 'OH').mass + tryptophan, 1, max_deletions=1)
+    groups = [delta_finder.group_solution(peptide, solution) for solution in solutions]
+
+    assert groups and all(group.count_placements() > 0 for group in groups)
+    assert not any({delta.description for delta in group.delta_set.deltas} == {"truncation of 'WA'", 'W'} for group in groups)
@@ -0,0 +1,39 @@
+from source import delta_finder
+from source.delta import DeltaType
+from source.peptide import Peptide
+from source.search_stats import SearchStats
+from source.tolerance_sweep import ToleranceSweep
+
+def get_query():
+    desired_peptide = Peptide('ACDEFGHIKLMNPQRSTVWYGGSAKLM', 'H', 'OH')
+    observed_peptide = Peptide('DEFGHIKLNPQRSTVWYGGSAKLM', 'H', 'OH')
+    return desired_peptide, desired_peptide.mass - observed_peptide.mass
+
+def get_ids(solutions):
+    return sorted(solution.ids for solution in solutions)
+
+def test_tolerance_sweep_matches_get_solutions():
+    peptide, target_mass = get_query()
+    stats = SearchStats()
+    sweep = ToleranceSweep(peptide, target_mass, stats=stats)
+
+    # Widening, narrowing and widening again, each compared with a fresh search
+    for confidence in [.5, 2, 1, .01, 4, 3]:
+        solutions = sweep.get_solutions(confidence)
+        assert get_ids(solutions) == get_ids(delta_finder.get_solutions(peptide, target_mass, confidence))
+        errors = [abs(solution.mass - target_mass) for solution in solutions]
+        assert errors == sorted(errors) and all(error <= confidence + 1e-6 for error in errors)
+
+    # Every solution was only found once, however many times the confidence was widened
+    assert stats.solutions == len(sweep.get_solutions(4))
+
+def test_narrowing_does_not_search():
+    peptide, target_mass = get_query()
+    stats = SearchStats()
+    sweep = ToleranceSweep(peptide, target_mass, delta_types={DeltaType.DELETION, DeltaType.OXIDATION}, stats=stats)
+
+    sweep.get_solutions(3)
+    nodes_expanded = stats.nodes_expanded
+    for confidence in [2, 1, .5, 3]:
+        assert get_ids(sweep.get_solutions(confidence)) == get_ids(delta_finder.get_solutions(peptide, target_mass, confidence, delta_types={DeltaType.DELETION, DeltaType.OXIDATION}))
+    assert stats.nodes_expanded == nodes_expanded